@@ -1,217 +1,369 @@
 import streamlit as st
-import pandas as pd
-from opensearchpy import OpenSearch
-import boto3
-import json
 import os
-from requests_aws4auth import AWS4Auth
 from dotenv import load_dotenv
 from datetime import datetime
 
+from src.metrics import metrics, request_trace
+from src.precompute import HISTORY_SEEDS, RRF_K
+
+# pandas, boto3, opensearch-py, scipy and the sentence encoder are imported by
+# the cached factories below, on first use, so a cold start only pays for
+# what the first page needs (Rental History needs no connections at all)
+
 load_dotenv()
 
+# "opensearch" (default) or "local" for the in-process vector store
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'opensearch').lower()
+VECTOR_STORE_PATH = os.getenv('VECTOR_STORE_PATH', 'data/vector_store')
+# AsyncOpenSearch on a shared event loop, so independent lookups run concurrently
+OPENSEARCH_ASYNC = os.getenv('OPENSEARCH_ASYNC', 'false').lower() == 'true'
+OPENSEARCH_HEALTH_TTL = float(os.getenv('OPENSEARCH_HEALTH_TTL', '10'))
+# Books per Book Browser page
+BROWSER_PAGE_SIZE = int(os.getenv('BROWSER_PAGE_SIZE', '25'))
+# Per-page timing breakdown under the page (DEBUG_PANEL=true)
+DEBUG_PANEL = os.getenv('DEBUG_PANEL', 'false').lower() == 'true'
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server(port):
+    # One Prometheus endpoint per server process, shared by every session
+    server = metrics.serve(port)
+    print(f"Serving metrics on :{port}/metrics")
+    return server
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def get_library_data(rental_mtime, catalog_mtime):
+    # The mtimes only key the cache: editing either CSV triggers a reload
+    from src.library_data import BOOK_CATALOG_PATH, RENTAL_HISTORY_PATH, LibraryData
+    return LibraryData(RENTAL_HISTORY_PATH, BOOK_CATALOG_PATH)
+
+@st.cache_resource(show_spinner=False)
+def create_connections():
+    # One pooled client per server process, shared by every session and rerun
+    from src.connections import create_bedrock_client, create_opensearch_client
+    return create_opensearch_client(), create_bedrock_client()
+
+@st.cache_resource(show_spinner=False)
+def get_health_check(_client):
+    from src.connections import HealthCheck
+    return HealthCheck(_client.ping, ttl=OPENSEARCH_HEALTH_TTL)
+
+@st.cache_resource(show_spinner=False)
+def get_async_vector_store(byte_fields):
+    from src.connections import EventLoopThread, HealthCheck, create_async_opensearch_client
+    from src.vector_store import AsyncOpenSearchVectorStore
+    
+    loop = EventLoopThread()
+    
+    async def connect():
+        # aiohttp sessions belong to the loop they are created on
+        return create_async_opensearch_client()
+    
+    client = loop.run(connect())
+    health = HealthCheck(lambda: loop.run(client.ping()), ttl=OPENSEARCH_HEALTH_TTL)
+    return AsyncOpenSearchVectorStore(
+        client, loop, byte_fields=byte_fields, health=health,
+        max_entries=int(os.getenv('BOOK_CACHE_SIZE', '10000')),
+        ttl=float(os.getenv('BOOK_CACHE_TTL', '300')),
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_snippet_generator(_bedrock_client):
+    from src.snippets import SnippetCache, SnippetGenerator
+    
+    cache = None
+    if os.getenv('SNIPPET_CACHE', 'true').lower() == 'true':
+        cache = SnippetCache(
+            os.getenv('SNIPPET_CACHE_PATH', 'data/snippet_cache.sqlite3'),
+            ttl=float(os.getenv('SNIPPET_CACHE_TTL', str(30 * 24 * 3600))),
+            max_entries=int(os.getenv('SNIPPET_CACHE_SIZE', '100000')),
+        )
+    return SnippetGenerator(
+        _bedrock_client,
+        cache=cache,
+        max_workers=int(os.getenv('SNIPPET_WORKERS', '5')),
+        timeout=float(os.getenv('BEDROCK_TIMEOUT', '10')),
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_book_store(_client):
+    from src.book_store import BookStore
+    return BookStore(
+        _client,
+        max_entries=int(os.getenv('BOOK_CACHE_SIZE', '10000')),
+        ttl=float(os.getenv('BOOK_CACHE_TTL', '300')),
+    )
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def get_local_vector_store(generation, _book_catalog):
+    # Keyed by the CURRENT generation so a new processing run is picked up
+    from src.vector_store import LocalVectorStore
+    return LocalVectorStore(VECTOR_STORE_PATH, _book_catalog)
+
+def get_vector_store(client, book_catalog):
+    from src.index_settings import knn_config_from_env
+    from src.vector_store import OpenSearchVectorStore, read_current_generation
+    
+    if VECTOR_BACKEND == 'local':
+        return get_local_vector_store(read_current_generation(VECTOR_STORE_PATH), book_catalog)
+    byte_fields = ('content_embedding',) if knn_config_from_env()['encoding'] == 'byte' else ()
+    if OPENSEARCH_ASYNC:
+        return get_async_vector_store(byte_fields)
+    return OpenSearchVectorStore(
+        client, book_store=get_book_store(client), byte_fields=byte_fields, health=get_health_check(client)
+    )
+
+@st.cache_data(ttl=float(os.getenv('BOOK_CACHE_TTL', '300')), show_spinner=False)
+def get_browser_facets(_browser, backend):
+    # Genre list and year bounds for the filters; one aggregation per TTL
+    return _browser.facets()
+
+@st.cache_resource(show_spinner="Loading the query encoder...")
+def get_query_encoder():
+    # Same model and backend the processor embeds descriptions with; imported
+    # here so pages that never encode text don't load it
+    from src.encoder import SentenceEncoder
+    encoder = SentenceEncoder(
+        'all-MiniLM-L6-v2',
+        backend=os.getenv('ENCODE_BACKEND', 'torch'),
+        onnx_file=os.getenv('ENCODE_ONNX_FILE'),
+    )
+    if os.getenv('EMBEDDING_CACHE', 'true').lower() != 'true':
+        return encoder
+    
+    # Queries get their own cache directory: the processor compacts the
+    # description cache in place, which would invalidate this process's mapping
+    from src.embedding_cache import CachedEncoder, EmbeddingCache
+    return CachedEncoder(
+        encoder,
+        EmbeddingCache(encoder.identity, os.getenv('QUERY_EMBEDDING_CACHE_DIR', 'data/query_embedding_cache')),
+        max_entries=int(os.getenv('QUERY_EMBEDDING_CACHE_MAX_ENTRIES', '10000')) or None,
+    )
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def get_local_hybrid_search(generation, _book_catalog, _vectors):
+    from src.hybrid_search import LocalHybridSearch
+    return LocalHybridSearch(_book_catalog, _vectors, encode=get_query_encoder().encode)
+
 class LibraryDatabaseApp:
     def __init__(self):
         self.client = None
         self.bedrock_client = None
-        self.setup_connections()
+        self.vectors = None
+        self.snippets = None
         self.load_data()
     
     def load_data(self):
-        self.rental_history = pd.read_csv('data/rental_history.csv')
-        self.book_catalog = pd.read_csv('data/book_catalog.csv')
-        
-        # Convert dates
-        self.rental_history['checkout_date'] = pd.to_datetime(self.rental_history['checkout_date'])
-        self.rental_history['return_date'] = pd.to_datetime(self.rental_history['return_date'])
-        
-        # Ensure book_id columns have consistent data types
-        self.rental_history['book_id'] = self.rental_history['book_id'].astype(int)
-        self.book_catalog['book_id'] = self.book_catalog['book_id'].astype(int)
+        from src.library_data import BOOK_CATALOG_PATH, RENTAL_HISTORY_PATH, source_mtimes
+        self.data = get_library_data(*source_mtimes(RENTAL_HISTORY_PATH, BOOK_CATALOG_PATH))
+        self.rental_history = self.data.rental_history
+        self.book_catalog = self.data.book_catalog
     
     def setup_connections(self):
-        host = os.getenv('OPENSEARCH_HOST', 'localhost')
-        port = int(os.getenv('OPENSEARCH_PORT', '9200'))
-        use_ssl = os.getenv('OPENSEARCH_USE_SSL', 'false').lower() == 'true'
-        
-        if use_ssl:
-            # AWS managed OpenSearch
-            region = os.getenv('AWS_REGION', 'us-east-2')
-            credentials = boto3.Session().get_credentials()
-            awsauth = AWS4Auth(credentials.access_key, credentials.secret_key, region, 'es', session_token=credentials.token)
-            
-            self.client = OpenSearch(
-                hosts=[{'host': host, 'port': 443}],
-                http_auth=awsauth,
-                use_ssl=True,
-                verify_certs=True,
-                connection_class=None,
-            )
-        else:
-            # Local OpenSearch
-            self.client = OpenSearch(
-                hosts=[{'host': host, 'port': port}],
-                use_ssl=False,
-                verify_certs=False,
-            )
-        
-        self.bedrock_client = boto3.client(
-            'bedrock-runtime',
-            region_name=os.getenv('AWS_REGION', 'us-east-2'),
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
+        self.client, self.bedrock_client = create_connections()
+        self.vectors = get_vector_store(self.client, self.data.book_catalog)
+        self.snippets = get_snippet_generator(self.bedrock_client)
     
     def get_user_reading_history(self, user_id):
-        rental_history = pd.read_csv('data/rental_history.csv')
-        user_books = rental_history[rental_history['user_id'] == user_id].tail(3)
+        book_ids = self.data.user_rentals(user_id).tail(HISTORY_SEEDS)['book_id'].tolist()
+        
+        try:
+            books = self.vectors.get_books(book_ids)
+        except Exception as e:
+            st.error(f"Error fetching books {book_ids}: {e}")
+            return []
         
         book_details = []
-        for _, row in user_books.iterrows():
-            try:
-                response = self.client.get(index="books", id=row['book_id'])
-                book_details.append(response['_source'])
-            except Exception as e:
-                st.error(f"Error fetching book {row['book_id']}: {e}")
+        for book_id in book_ids:
+            if book_id in books:
+                book_details.append(books[book_id])
+            else:
+                st.error(f"Error fetching book {book_id}: not found")
         
         return book_details
     
     def find_similar_books(self, book_embedding, num_recommendations=5):
-        query = {
-            "query": {
-                "knn": {
-                    "content_embedding": {
-                        "vector": book_embedding,
-                        "k": num_recommendations
-                    }
-                }
-            }
-        }
-        
         try:
-            response = self.client.search(index="books", body=query)
-            return [hit['_source'] for hit in response['hits']['hits']]
+            return self.vectors.knn('content_embedding', [book_embedding], num_recommendations)[0]
         except Exception as e:
             st.error(f"Error searching for similar books: {e}")
             return []
     
+    def get_read_book_ids(self, user_id):
+        return [int(book_id) for book_id in self.data.user_rentals(user_id)['book_id'].unique()]
+    
+    def get_content_recommendations(self, user_id, reading_history, num_recommendations=5):
+        read_ids = self.get_read_book_ids(user_id)
+        embeddings = self.vectors.get_vectors([b['book_id'] for b in reading_history], 'content_embedding')
+        seeds = [book for book in reading_history if book['book_id'] in embeddings]
+        if not seeds:
+            return []
+        
+        # One round trip for every seed, read books excluded by the backend
+        results = self.vectors.knn(
+            'content_embedding',
+            [embeddings[seed['book_id']] for seed in seeds],
+            num_recommendations,
+            exclude_ids=read_ids
+        )
+        return self.fuse_seed_results(seeds, results, num_recommendations)
+    
+    def fuse_seed_results(self, seeds, results, num_recommendations):
+        # Reciprocal rank fusion across seeds; each result keeps the seed that ranked it highest
+        scores = {}
+        best = {}
+        for seed, hits in zip(seeds, results):
+            for rank, book in enumerate(hits):
+                book_id = book['book_id']
+                scores[book_id] = scores.get(book_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+                if book_id not in best or rank < best[book_id][0]:
+                    best[book_id] = (rank, seed, book)
+        
+        ranked = sorted(scores, key=lambda book_id: (-scores[book_id], book_id))
+        return [(best[book_id][1], best[book_id][2]) for book_id in ranked[:num_recommendations]]
+    
+    def get_precomputed_recommendations(self, user_id):
+        return self.precomputed_from_document(user_id, self.vectors.get_user_document(user_id))
+    
+    def precomputed_from_document(self, user_id, source):
+        if source is None or 'content_recommendations' not in source:
+            return None
+        
+        # Stale if the student borrowed anything since the last processing run
+        rentals = self.data.user_rentals(user_id)
+        if (source['rental_count'] != len(rentals)
+                or source['history_book_ids'] != rentals.tail(HISTORY_SEEDS)['book_id'].tolist()):
+            return None
+        
+        content = source['content_recommendations']
+        collaborative = source['collaborative_recommendations']
+        books = self.vectors.get_books(
+            [rec['book_id'] for rec in content] + [rec['seed_book_id'] for rec in content] + collaborative
+        )
+        
+        # Books deleted since the run are skipped
+        content_recommendations = []
+        snippets = {}
+        for rec in content:
+            if rec['book_id'] in books and rec['seed_book_id'] in books:
+                if 'snippet' in rec:
+                    snippets[len(content_recommendations)] = rec['snippet']
+                content_recommendations.append((books[rec['seed_book_id']], books[rec['book_id']]))
+        collab_recommendations = [books[book_id] for book_id in collaborative if book_id in books]
+        
+        return content_recommendations, snippets, collab_recommendations
+    
+    def get_recommendations(self, user_id, reading_history, num_recommendations=5):
+        try:
+            precomputed = self.get_precomputed_recommendations(user_id)
+        except Exception as e:
+            st.error(f"Error loading precomputed recommendations: {e}")
+            precomputed = None
+        if precomputed is not None:
+            return precomputed
+        
+        try:
+            content_recommendations = self.get_content_recommendations(
+                user_id, reading_history, num_recommendations=num_recommendations
+            )
+        except Exception as e:
+            st.error(f"Error searching for similar books: {e}")
+            content_recommendations = []
+        
+        collab_recommendations = self.get_collaborative_recommendations(
+            user_id, num_recommendations=num_recommendations
+        )
+        return content_recommendations, {}, collab_recommendations
+    
+    def load_recommendations(self, user_id, num_recommendations=5):
+        # Concurrent variant of get_user_reading_history + get_recommendations for
+        # the async store: history books, the precomputed document, the student's
+        # factors and the seed vectors go out together, then both searches if needed
+        history_ids = self.data.user_rentals(user_id).tail(HISTORY_SEEDS)['book_id'].tolist()
+        books, source, user_vector, seed_vectors = self.vectors.batch(
+            ('get_books', history_ids),
+            ('get_user_document', user_id),
+            ('get_user_vector', user_id),
+            ('get_vectors', history_ids, 'content_embedding'),
+        )
+        reading_history = [books[book_id] for book_id in history_ids if book_id in books]
+        
+        precomputed = self.precomputed_from_document(user_id, source)
+        if precomputed is not None:
+            return (reading_history,) + precomputed
+        
+        read_ids = self.get_read_book_ids(user_id)
+        seeds = [book for book in reading_history if book['book_id'] in seed_vectors]
+        searches = []
+        if seeds:
+            searches.append(('knn', 'content_embedding', [seed_vectors[seed['book_id']] for seed in seeds],
+                             num_recommendations, read_ids))
+        if user_vector is not None:
+            searches.append(('knn', 'collaborative_features', [user_vector], num_recommendations, read_ids))
+        results = self.vectors.batch(*searches)
+        
+        content_recommendations = self.fuse_seed_results(seeds, results[0], num_recommendations) if seeds else []
+        collab_recommendations = results[-1][0] if user_vector is not None else []
+        return reading_history, content_recommendations, {}, collab_recommendations
+    
     def get_collaborative_recommendations(self, user_id, num_recommendations=5):
         try:
-            # Query for books with collaborative_features
-            query = {
-                "query": {"match_all": {}},
-                "size": 100
-            }
-            
-            response = self.client.search(index="books", body=query)
-            books_with_collab = [hit['_source'] for hit in response['hits']['hits'] 
-                               if 'collaborative_features' in hit['_source']]
-            
-            if not books_with_collab:
+            user_vector = self.vectors.get_user_vector(user_id)
+            if user_vector is None:
+                # Student has no rentals in the last processing run
                 return []
             
-            # Get user's reading history book IDs
-            user_books = self.rental_history[self.rental_history['user_id'] == user_id]['book_id'].tolist()
-            
-            # Score books based on collaborative features
-            recommendations = []
-            for book in books_with_collab:
-                if book['book_id'] not in user_books:
-                    # Use collaborative_features as similarity score
-                    collab_score = sum(book['collaborative_features'])
-                    recommendations.append((book, collab_score))
-            
-            # Sort by collaborative score and return top recommendations
-            recommendations.sort(key=lambda x: x[1], reverse=True)
-            return [book for book, score in recommendations[:num_recommendations]]
+            return self.vectors.knn(
+                'collaborative_features',
+                [user_vector],
+                num_recommendations,
+                exclude_ids=self.get_read_book_ids(user_id)
+            )[0]
             
         except Exception as e:
             st.error(f"Error getting collaborative recommendations: {e}")
             return []
 
     def generate_recommendation_snippet(self, user_book, recommended_book):
-        prompt = f"""
-        Create a short, engaging recommendation snippet (1-2 sentences) explaining why someone who enjoyed "{user_book['title']}" by {user_book['author']} would like "{recommended_book['title']}" by {recommended_book['author']}.
-        
-        User's book: {user_book['description']}
-        Recommended book: {recommended_book['description']}
-        
-        Start with "Because you liked..." and make it personal and specific.
-        """
-        
-        try:
-            body = json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 100,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            })
-            
-            response = self.bedrock_client.invoke_model(
-                body=body,
-                modelId="us.anthropic.claude-3-haiku-20240307-v1:0",
-                accept="application/json",
-                contentType="application/json"
-            )
-            
-            response_body = json.loads(response.get('body').read())
-            return response_body['content'][0]['text'].strip()
-        
-        except Exception as e:
-            return f"You might enjoy this book based on your interest in {user_book['genre']} stories."
+        return self.snippets.generate(user_book, recommended_book)
     
     def show_rental_history(self):
         st.header("📚 Rental History")
+        analytics = self.data.analytics
         
-        # Get unique students for filter
-        students = ['All Students'] + sorted(self.rental_history['student_name'].unique().tolist())
+        # Students are listed by id since names are not unique
+        students = ['All Students'] + list(analytics.student_labels)
         selected_student = st.selectbox("Filter by Student:", students)
-        
-        # Filter data
-        if selected_student != 'All Students':
-            filtered_history = self.rental_history[self.rental_history['student_name'] == selected_student]
-        else:
-            filtered_history = self.rental_history
-        
-        # Merge with book details
-        history_with_books = filtered_history.merge(
-            self.book_catalog[['book_id', 'title', 'author', 'genre']], 
-            on='book_id', 
-            how='left'
-        )
-        
-        # Sort by checkout date (latest first)
-        history_with_books = history_with_books.sort_values('checkout_date', ascending=False)
+        user_id = analytics.student_labels.get(selected_student)
         
         # Display statistics
+        summary = analytics.summary(user_id, now=datetime.now())
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Rentals", len(history_with_books))
+            st.metric("Total Rentals", summary['rentals'])
         with col2:
-            st.metric("Unique Students", len(filtered_history['student_name'].unique()))
+            st.metric("Unique Students", summary['students'])
         with col3:
-            st.metric("Unique Books", len(filtered_history['book_id'].unique()))
+            st.metric("Unique Books", summary['books'])
         with col4:
-            current_rentals = filtered_history[filtered_history['return_date'] > datetime.now()]
-            st.metric("Current Rentals", len(current_rentals))
+            st.metric("Current Rentals", summary['current'])
         
         st.divider()
         
-        # Display rental history table
+        # Display rental history table, one page at a time (latest first)
         st.subheader("Recent Rentals")
         
-        # Format the display dataframe
-        display_df = history_with_books[['student_name', 'title', 'author', 'genre', 'checkout_date', 'return_date']].copy()
-        display_df['checkout_date'] = display_df['checkout_date'].dt.strftime('%Y-%m-%d')
-        display_df['return_date'] = display_df['return_date'].dt.strftime('%Y-%m-%d')
-        display_df.columns = ['Student', 'Book Title', 'Author', 'Genre', 'Checkout Date', 'Return Date']
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            page_size = st.selectbox("Rows per page:", [25, 50, 100, 500], index=1)
+        page_count = analytics.page_count(user_id, page_size)
+        with col2:
+            # Keyed by the filter so switching student or page size starts over at page 1
+            page = st.number_input(f"Page (of {page_count}):", min_value=1, max_value=page_count, value=1,
+                                   key=f"rental_page_{selected_student}_{page_size}")
         
         st.dataframe(
-            display_df,
+            analytics.page(user_id, page=int(page), page_size=page_size),
             use_container_width=True,
             hide_index=True
         )
@@ -220,26 +372,28 @@ class LibraryDatabaseApp:
         st.header("🎯 AI Book Recommendations")
         st.write("Get personalized book recommendations based on reading history!")
         
-        try:
-            self.client.info()
-        except Exception:
+        if not self.vectors.ping():
             st.error("Cannot connect to OpenSearch. Please check your configuration.")
             return
         
-        # Get unique user IDs for dropdown
-        user_ids = sorted(self.rental_history['user_id'].unique().tolist())
-        user_names = []
-        for uid in user_ids:
-            name = self.rental_history[self.rental_history['user_id'] == uid]['student_name'].iloc[0]
-            user_names.append(f"{name} ({uid})")
-        
-        selected_user = st.selectbox("Select Student:", user_names)
+        # "Name (user_id)" labels, sorted by user id
+        student_labels = self.data.analytics.student_labels
+        selected_user = st.selectbox("Select Student:", list(student_labels))
         
         if selected_user and st.button("Get Recommendations"):
-            user_id = selected_user.split('(')[1].split(')')[0]
+            user_id = student_labels[selected_user]
             
             with st.spinner("Finding your perfect next read..."):
-                reading_history = self.get_user_reading_history(user_id)
+                recommendations = None
+                if self.vectors.concurrent:
+                    try:
+                        recommendations = self.load_recommendations(user_id, num_recommendations=5)
+                    except Exception as e:
+                        st.error(f"Error loading recommendations: {e}")
+                        return
+                    reading_history = recommendations[0]
+                else:
+                    reading_history = self.get_user_reading_history(user_id)
                 
                 if not reading_history:
                     st.warning("No reading history found for this student.")
@@ -253,26 +407,15 @@ class LibraryDatabaseApp:
                 
                 st.subheader("🎯 Based on your reading history:")
                 
-                all_recommendations = []
-                for user_book in reading_history:
-                    similar_books = self.find_similar_books(
-                        user_book['content_embedding'], 
-                        num_recommendations=3
+                if recommendations is not None:
+                    _, content_recommendations, snippets, collab_recommendations = recommendations
+                else:
+                    content_recommendations, snippets, collab_recommendations = self.get_recommendations(
+                        user_id, reading_history, num_recommendations=5
                     )
-                    
-                    for rec_book in similar_books:
-                        if rec_book['book_id'] not in [b['book_id'] for b in reading_history]:
-                            if rec_book not in all_recommendations:
-                                all_recommendations.append((user_book, rec_book))
-                
-                seen_books = set()
-                unique_recommendations = []
-                for user_book, rec_book in all_recommendations:
-                    if rec_book['book_id'] not in seen_books:
-                        unique_recommendations.append((user_book, rec_book))
-                        seen_books.add(rec_book['book_id'])
                 
-                for i, (user_book, rec_book) in enumerate(unique_recommendations[:5]):
+                snippet_slots = []
+                for i, (user_book, rec_book) in enumerate(content_recommendations):
                     with st.container():
                         col1, col2 = st.columns([3, 1])
                         
@@ -281,8 +424,13 @@ class LibraryDatabaseApp:
                             st.write(f"*by {rec_book['author']} ({rec_book['publication_year']})*")
                             st.write(f"**Genre:** {rec_book['genre']}")
                             
-                            snippet = self.generate_recommendation_snippet(user_book, rec_book)
-                            st.write(f"💡 {snippet}")
+                            # Filled in below as the snippets come back
+                            slot = st.empty()
+                            if i in snippets:
+                                slot.write(f"💡 {snippets[i]}")
+                            else:
+                                slot.write("💡 *Writing a recommendation...*")
+                            snippet_slots.append(slot)
                             
                             with st.expander("Book Description"):
                                 st.write(rec_book['description'])
@@ -292,11 +440,14 @@ class LibraryDatabaseApp:
                         
                         st.divider()
                 
+                pending = [i for i in range(len(content_recommendations)) if i not in snippets]
+                pairs = [content_recommendations[i] for i in pending]
+                for j, snippet in self.snippets.generate_many(pairs):
+                    snippet_slots[pending[j]].write(f"💡 {snippet}")
+                
                 # Collaborative filtering recommendations
                 st.subheader("👥 Based on other readers like you:")
                 
-                collab_recommendations = self.get_collaborative_recommendations(user_id, num_recommendations=5)
-                
                 if collab_recommendations:
                     for rec_book in collab_recommendations:
                         with st.container():
@@ -319,90 +470,238 @@ class LibraryDatabaseApp:
                 else:
                     st.info("No collaborative filtering data available yet.")
     
+    def get_book_browser(self):
+        from src.book_browser import LocalBookBrowser, OpenSearchBookBrowser
+        if VECTOR_BACKEND == 'local':
+            return LocalBookBrowser(self.data.book_catalog, self.vectors)
+        return OpenSearchBookBrowser(self.client)
+    
+    def get_hybrid_search(self):
+        from src.hybrid_search import OpenSearchHybridSearch
+        from src.index_settings import knn_config_from_env
+        from src.vector_store import read_current_generation
+        
+        if VECTOR_BACKEND == 'local':
+            return get_local_hybrid_search(read_current_generation(VECTOR_STORE_PATH), self.data.book_catalog,
+                                           self.vectors)
+        byte_fields = ('content_embedding',) if knn_config_from_env()['encoding'] == 'byte' else ()
+        return OpenSearchHybridSearch(
+            self.client, encode=get_query_encoder().encode, vectors=self.vectors, byte_fields=byte_fields
+        )
+    
+    def show_librarian_search(self):
+        st.header("🔎 Librarian Search")
+        st.write("Search by keywords and meaning, optionally tailored to a student, within a genre and year range")
+        
+        if VECTOR_BACKEND != 'local' and not get_health_check(self.client).ok():
+            st.error("Cannot connect to OpenSearch. Please check your configuration.")
+            return
+        
+        try:
+            genres, year_range = get_browser_facets(self.get_book_browser(), VECTOR_BACKEND)
+        except Exception as e:
+            st.error(f"Error loading filters: {e}")
+            return
+        
+        with st.form("librarian_search"):
+            text = st.text_input("Search:", placeholder="e.g. space adventure for young readers")
+            col1, col2 = st.columns(2)
+            with col1:
+                selected_genres = st.multiselect("Genre:", genres)
+                students = ['Any student'] + list(self.data.analytics.student_labels)
+                selected_student = st.selectbox("Tailor to student:", students)
+            with col2:
+                years = None
+                if year_range and year_range[0] < year_range[1]:
+                    years = st.slider("Publication year:", year_range[0], year_range[1], year_range)
+                    if tuple(years) == tuple(year_range):
+                        years = None
+                num_results = st.slider("Number of results:", 5, 50, 10)
+            submitted = st.form_submit_button("Search")
+        
+        if not submitted:
+            return
+        
+        user_id = self.data.analytics.student_labels.get(selected_student)
+        try:
+            # Lexical, content and collaborative matches, filtered and fused in one search
+            results = self.get_hybrid_search().search(
+                text=text, genres=selected_genres, years=years, user_id=user_id, k=num_results
+            )
+        except Exception as e:
+            st.error(f"Search failed: {e}")
+            return
+        
+        if not results:
+            st.warning("No books match these filters.")
+            return
+        
+        st.subheader(f"Top {len(results)} results")
+        st.dataframe(
+            [
+                {
+                    "Score": None if book['score'] is None else round(book['score'], 3),
+                    "Book ID": book['book_id'],
+                    "Title": book['title'],
+                    "Author": book['author'],
+                    "Genre": book['genre'],
+                    "Year": book['publication_year'],
+                }
+                for book in results
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+    
     def show_book_browser(self):
         st.header("📖 Book Browser")
         st.write("Browse all books in the database and view their stored data")
         
-        try:
-            self.client.info()
-        except Exception:
+        if VECTOR_BACKEND != 'local' and not get_health_check(self.client).ok():
             st.error("Cannot connect to OpenSearch. Please check your configuration.")
             return
         
-        # Get all books from OpenSearch
+        browser = self.get_book_browser()
         try:
-            response = self.client.search(
-                index="books",
-                body={
-                    "size": 100,
-                    "query": {"match_all": {}},
-                    "sort": [{"book_id": {"order": "asc"}}]
-                }
+            genres, year_range = get_browser_facets(browser, VECTOR_BACKEND)
+        except Exception as e:
+            st.error(f"Error loading books: {e}")
+            return
+        
+        # Filters run in the search itself; only one page of titles comes back
+        col1, col2, col3 = st.columns([2, 2, 2])
+        with col1:
+            text = st.text_input("Search title, author or description:").strip()
+        with col2:
+            selected_genres = st.multiselect("Genre:", genres)
+        with col3:
+            years = None
+            if year_range and year_range[0] < year_range[1]:
+                years = st.slider("Publication year:", year_range[0], year_range[1], year_range)
+                if tuple(years) == tuple(year_range):
+                    years = None
+        
+        # search_after cursors of the pages seen so far; a new filter starts over
+        signature = (text, tuple(selected_genres), years)
+        if st.session_state.get('browser_signature') != signature:
+            st.session_state['browser_signature'] = signature
+            st.session_state['browser_cursors'] = [None]
+        cursors = st.session_state['browser_cursors']
+        
+        try:
+            books, next_cursor, total = browser.search(
+                text=text, genres=selected_genres, years=years, search_after=cursors[-1], size=BROWSER_PAGE_SIZE
             )
-            
-            books = [hit['_source'] for hit in response['hits']['hits']]
-            
-            if not books:
-                st.warning("No books found in the database.")
+        except Exception as e:
+            st.error(f"Error loading books: {e}")
+            return
+        
+        if not books:
+            st.warning("No books found in the database.")
+            return
+        
+        first = (len(cursors) - 1) * BROWSER_PAGE_SIZE + 1
+        st.subheader(f"Found {total} books (showing {first}-{first + len(books) - 1})")
+        
+        col1, col2, _ = st.columns([1, 1, 4])
+        with col1:
+            if st.button("← Previous", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            if st.button("Next →", disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
+        
+        # Create dropdown with book titles and IDs
+        book_options = [f"{book['book_id']}: {book['title']} by {book['author']}" for book in books]
+        selected_book_option = st.selectbox("Select a book to view details:", book_options)
+        
+        if selected_book_option:
+            # Extract book_id from selection; the full document (vectors included)
+            # is only fetched for this one book
+            book_id = int(selected_book_option.split(':')[0])
+            try:
+                selected_book = browser.get_document(book_id)
+            except Exception as e:
+                st.error(f"Error loading book {book_id}: {e}")
+                return
+            if selected_book is None:
+                st.warning(f"Book {book_id} is no longer in the database.")
                 return
             
-            st.subheader(f"Found {len(books)} books")
+            st.divider()
             
-            # Create dropdown with book titles and IDs
-            book_options = [f"{book['book_id']}: {book['title']} by {book['author']}" for book in books]
-            selected_book_option = st.selectbox("Select a book to view details:", book_options)
+            # Display book details in a nice format
+            col1, col2 = st.columns([2, 1])
             
-            if selected_book_option:
-                # Extract book_id from selection
-                book_id = int(selected_book_option.split(':')[0])
-                selected_book = next(book for book in books if book['book_id'] == book_id)
-                
-                st.divider()
-                
-                # Display book details in a nice format
-                col1, col2 = st.columns([2, 1])
+            with col1:
+                st.subheader(f"{selected_book['title']}")
+                st.write(f"**Author:** {selected_book['author']}")
+                st.write(f"**Genre:** {selected_book['genre']}")
+                st.write(f"**Publication Year:** {selected_book['publication_year']}")
+                st.write(f"**ISBN:** {selected_book.get('isbn')}")
                 
-                with col1:
-                    st.subheader(f"{selected_book['title']}")
-                    st.write(f"**Author:** {selected_book['author']}")
-                    st.write(f"**Genre:** {selected_book['genre']}")
-                    st.write(f"**Publication Year:** {selected_book['publication_year']}")
-                    st.write(f"**ISBN:** {selected_book['isbn']}")
-                    
-                    with st.expander("Description"):
-                        st.write(selected_book['description'])
-                
-                with col2:
-                    st.metric("Book ID", selected_book['book_id'])
-                    
-                    if 'content_embedding' in selected_book:
-                        embedding_len = len(selected_book['content_embedding'])
-                        st.metric("Content Embedding", f"{embedding_len} dims")
-                    
-                    if 'collaborative_features' in selected_book:
-                        collab_len = len(selected_book['collaborative_features'])
-                        st.metric("Collaborative Features", f"{collab_len} dims")
+                with st.expander("Description"):
+                    st.write(selected_book.get('description'))
+            
+            with col2:
+                st.metric("Book ID", selected_book['book_id'])
                 
-                # Show raw JSON data
-                st.subheader("Raw OpenSearch Document")
-                st.json(selected_book)
+                if 'content_embedding' in selected_book:
+                    embedding_len = len(selected_book['content_embedding'])
+                    st.metric("Content Embedding", f"{embedding_len} dims")
                 
-        except Exception as e:
-            st.error(f"Error loading books: {e}")
+                if 'collaborative_features' in selected_book:
+                    collab_len = len(selected_book['collaborative_features'])
+                    st.metric("Collaborative Features", f"{collab_len} dims")
+            
+            # Show raw JSON data
+            st.subheader("Raw OpenSearch Document" if VECTOR_BACKEND != 'local' else "Raw Book Document")
+            st.json(selected_book)
     
     def run_app(self):
         st.title("🏢 Readington Library Management System")
         
         # Sidebar navigation
         st.sidebar.title("Navigation")
-        page = st.sidebar.radio("Go to:", ["Rental History", "Book Recommendations", "Book Browser"])
+        page = st.sidebar.radio("Go to:", ["Rental History", "Book Recommendations", "Librarian Search", "Book Browser"])
         
         if page == "Rental History":
             self.show_rental_history()
-        elif page == "Book Recommendations":
+            return
+        
+        # Only the pages that search need clients and the vector store
+        self.setup_connections()
+        if page == "Book Recommendations":
             self.show_recommendations()
+        elif page == "Librarian Search":
+            self.show_librarian_search()
         elif page == "Book Browser":
             self.show_book_browser()
+    
+    def show_debug_panel(self, trace):
+        with st.expander(f"⏱️ Timing breakdown ({trace.total_ms():.0f} ms)"):
+            if not trace:
+                st.write("No OpenSearch, Bedrock or loading calls on this run.")
+                return
+            
+            rows = [
+                {
+                    "Span": span['span'],
+                    "Labels": ", ".join(f"{k}={v}" for k, v in span['labels'].items()),
+                    "Start (ms)": round(span['start_ms'], 1),
+                    "Duration (ms)": round(span['duration_ms'], 1),
+                    "Status": span['status'],
+                }
+                for span in sorted(trace, key=lambda span: span['start_ms'])
+            ]
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+            
+            totals = {}
+            for span in trace:
+                totals[span['span']] = totals.get(span['span'], 0.0) + span['duration_ms']
+            st.write(" · ".join(f"**{name}** {ms:.0f} ms" for name, ms in sorted(totals.items(), key=lambda item: -item[1])))
 
 def main():
     st.set_page_config(
@@ -411,8 +710,17 @@ def main():
         layout="wide"
     )
     
-    app = LibraryDatabaseApp()
-    app.run_app()
+    metrics_port = int(os.getenv('METRICS_PORT', '0'))
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    
+    # Everything this rerun does, including cold data loads, lands in one trace
+    with request_trace() as trace:
+        app = LibraryDatabaseApp()
+        app.run_app()
+    
+    if DEBUG_PANEL:
+        app.show_debug_panel(trace)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
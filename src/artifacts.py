@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from src.generations import new_generation_dir, publish_generation
+from src.library_data import load_embeddings, save_embeddings
+
+# Versioned bundle of what the expensive processing stages produce, so later
+# stages (and reruns with --only) reuse it instead of re-encoding or refitting:
+#
+#   data/artifacts/CURRENT                       -> v20250101120000
+#   data/artifacts/v20250101120000/manifest.json    versions, fingerprints, dims
+#       book_ids.npy, content_embedding.npy          rows in catalog order
+#       book_hashes.json                             content hash of each embedded book
+#       collaborative_features.npy
+#       user_ids.npy, user_factors.npy
+#       recommendations.json                         precomputed users documents
+#
+# Arrays are plain .npy files (load_embeddings memory-maps them).
+
+ARTIFACTS_PATH = 'data/artifacts'
+
+MATRIX_ARTIFACTS = ('content_embedding', 'collaborative_features')
+ARTIFACT_FILES = {
+    "content_embedding": ['content_embedding.npy', 'book_hashes.json'],
+    "collaborative_features": ['collaborative_features.npy'],
+    "user_factors": ['user_ids.npy', 'user_factors.npy'],
+    "recommendations": ['recommendations.json'],
+}
+# Rebuilding an artifact invalidates the ones computed from it
+DEPENDENTS = {
+    "content_embedding": ['recommendations'],
+    "collaborative_features": ['recommendations'],
+    "user_factors": ['recommendations'],
+}
+
+
+class ArtifactBundle:
+    def __init__(self, path):
+        self.path = path
+        self.version = os.path.basename(path)
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+
+    def has(self, name):
+        return name in self.manifest['artifacts']
+
+    def book_ids(self):
+        return np.load(os.path.join(self.path, 'book_ids.npy'))
+
+    def book_hashes(self):
+        # book_id -> content hash of the descriptions content_embedding was built from
+        path = os.path.join(self.path, 'book_hashes.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def load(self, name):
+        if name in MATRIX_ARTIFACTS:
+            return load_embeddings(self.path, name)[1]
+        if name == 'user_factors':
+            user_ids = np.load(os.path.join(self.path, 'user_ids.npy')).tolist()
+            return dict(zip(user_ids, np.load(os.path.join(self.path, 'user_factors.npy'))))
+        if name == 'recommendations':
+            with open(os.path.join(self.path, 'recommendations.json')) as f:
+                return json.load(f)
+        raise KeyError(f"Unknown artifact {name!r}")
+
+
+class ArtifactStore:
+    def __init__(self, path, versions_to_keep=2):
+        self.path = path
+        self.versions_to_keep = max(1, versions_to_keep)
+
+    def current(self):
+        current_path = os.path.join(self.path, 'CURRENT')
+        if not os.path.exists(current_path):
+            return None
+        with open(current_path) as f:
+            return ArtifactBundle(os.path.join(self.path, f.read().strip()))
+
+    def write(self, book_ids, artifacts, artifact_meta=None, meta=None, base=None, book_hashes=None):
+        # New version with the given artifacts; anything else the base version
+        # holds is carried over (hard-linked) unless it depends on a rebuilt one
+        # or its rows belong to a different catalog
+        version = new_generation_dir(self.path)
+        version_path = os.path.join(self.path, version)
+
+        stale = {dependent for name in artifacts for dependent in DEPENDENTS.get(name, [])}
+        same_books = base is not None and np.array_equal(base.book_ids(), np.asarray(book_ids, dtype=np.int64))
+        entries = {}
+        if base is not None:
+            for name, entry in base.manifest['artifacts'].items():
+                if name in artifacts or name in stale or (name in MATRIX_ARTIFACTS and not same_books):
+                    continue
+                for file_name in ARTIFACT_FILES[name]:
+                    if os.path.exists(os.path.join(base.path, file_name)):
+                        link_or_copy(os.path.join(base.path, file_name), os.path.join(version_path, file_name))
+                entries[name] = entry
+
+        for name, value in artifacts.items():
+            if name in MATRIX_ARTIFACTS:
+                save_embeddings(version_path, book_ids, value, name=name)
+                entries[name] = {"version": version, "dimension": int(np.shape(value)[1])}
+            elif name == 'user_factors':
+                user_ids = [str(user_id) for user_id in value]
+                np.save(os.path.join(version_path, 'user_ids.npy'), np.asarray(user_ids, dtype=str))
+                np.save(os.path.join(version_path, 'user_factors.npy'),
+                        np.asarray([value[user_id] for user_id in value], dtype=np.float32))
+                entries[name] = {"version": version, "users": len(user_ids)}
+            elif name == 'recommendations':
+                with open(os.path.join(version_path, 'recommendations.json'), 'w') as f:
+                    json.dump({str(user_id): doc for user_id, doc in value.items()}, f)
+                entries[name] = {"version": version, "users": len(value)}
+            entries[name].update((artifact_meta or {}).get(name, {}))
+        if 'content_embedding' in artifacts and book_hashes is not None:
+            with open(os.path.join(version_path, 'book_hashes.json'), 'w') as f:
+                json.dump(book_hashes, f)
+        if not os.path.exists(os.path.join(version_path, 'book_ids.npy')):
+            np.save(os.path.join(version_path, 'book_ids.npy'), np.asarray(book_ids, dtype=np.int64))
+
+        manifest = dict(meta or {})
+        manifest.update({"version": version, "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'), "artifacts": entries})
+        with open(os.path.join(version_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        publish_generation(self.path, version, self.versions_to_keep)
+        return ArtifactBundle(version_path)
+
+
+def link_or_copy(source, destination):
+    # Unchanged artifacts cost no disk space where hard links are supported
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.library_data import LibraryData
+from src.snippets import SnippetGenerator, StubBedrockClient
+
+load_dotenv()
+
+# Times each offline processing stage and the app's online recommendation
+# calls on a dataset directory (see src/synthetic_data.py), and writes the
+# results as JSON so runs can be diffed for regressions:
+#
+#   python -m src.synthetic_data --scale 100k
+#   python -m src.benchmark --data-dir data/synthetic/100k --backend local --output bench.json
+#
+# --backend local runs everything in-process; --backend opensearch indexes into
+# bench_books/bench_users aliases so the live books/users indexes are untouched.
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(latencies):
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "calls": len(latencies),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "mean_ms": float(latencies_ms.mean()),
+        "calls_per_sec": float(len(latencies) / max(sum(latencies), 1e-9)),
+    }
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, fn, rows=None):
+        print(f"[{name}] running...")
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        stage = {"seconds": seconds, "peak_rss_mb": peak_rss_mb()}
+        if rows:
+            stage['rows'] = rows
+            stage['rows_per_sec'] = rows / max(seconds, 1e-9)
+        self.stages[name] = stage
+        print(f"[{name}] {seconds:.2f}s, peak RSS {stage['peak_rss_mb']:.0f} MB")
+        return result
+
+
+def fake_embeddings(n, dimension, seed):
+    vectors = np.random.default_rng(seed).standard_normal((n, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_offline(args, timer):
+    from src.process_data import BookRecommendationProcessor
+
+    processor = BookRecommendationProcessor()
+    processor.book_catalog_path = os.path.join(args.data_dir, 'book_catalog.csv')
+    processor.rental_history_path = os.path.join(args.data_dir, 'rental_history.csv')
+    processor.vector_store_path = os.path.join(args.work_dir, 'vector_store')
+    processor.index_alias = 'bench_books'
+    processor.user_index_alias = 'bench_users'
+    if not args.embedding_cache:
+        # Measure cold encoding, not cache hits from a previous run
+        processor.use_embedding_cache = False
+
+    try:
+        book_catalog, rental_history = timer.run('load', processor.load_data)
+        rows = len(book_catalog)
+
+        if args.fake_embeddings:
+            content_embeddings = timer.run('encode', lambda: fake_embeddings(rows, 384, args.seed), rows=rows)
+        else:
+            content_embeddings = timer.run(
+                'encode', lambda: processor.generate_content_embeddings(book_catalog), rows=rows
+            )
+
+        collaborative_factors = timer.run(
+            'svd_fit',
+            lambda: processor.generate_collaborative_embeddings(rental_history, book_catalog),
+            rows=len(rental_history)
+        )
+        user_factors = processor.generate_user_factors()
+        recommendations = timer.run(
+            'precompute',
+            lambda: processor.precompute_recommendations(
+                book_catalog, rental_history, content_embeddings, collaborative_factors, user_factors
+            ),
+            rows=len(user_factors)
+        )
+
+        if args.backend == 'local':
+            timer.run('index', lambda: processor.export_local_store(
+                book_catalog, content_embeddings, collaborative_factors, user_factors, recommendations
+            ), rows=rows)
+            return None
+
+        if not processor.connect_opensearch():
+            raise SystemExit("Failed to connect to OpenSearch")
+
+        def index():
+            index_name = processor.create_index()
+            user_index_name = processor.create_user_index()
+            processor.bulk_index_books(book_catalog, content_embeddings, collaborative_factors, index_name=index_name)
+            processor.bulk_index_docs(
+                processor.iter_user_actions(user_factors, recommendations), index_name=user_index_name
+            )
+            processor.warm_index(index_name)
+            processor.swap_aliases({processor.index_alias: index_name, processor.user_index_alias: user_index_name})
+            processor.prune_old_indexes(index_name, processor.index_alias)
+            processor.prune_old_indexes(user_index_name, processor.user_index_alias)
+
+        timer.run('index', index, rows=rows)
+        return processor.client
+    finally:
+        processor.close()
+
+
+def build_app(args, client):
+    from app import LibraryDatabaseApp
+    from src.index_settings import knn_config_from_env
+    from src.vector_store import LocalVectorStore, OpenSearchVectorStore
+
+    # The app without Streamlit's session: same data, vector store and
+    # snippet generator, with Bedrock replaced by the stub and no snippet cache
+    app = LibraryDatabaseApp.__new__(LibraryDatabaseApp)
+    app.data = LibraryData(
+        os.path.join(args.data_dir, 'rental_history.csv'), os.path.join(args.data_dir, 'book_catalog.csv')
+    )
+    app.rental_history = app.data.rental_history
+    app.book_catalog = app.data.book_catalog
+    app.client = client
+    app.bedrock_client = StubBedrockClient(latency=args.bedrock_latency)
+    app.snippets = SnippetGenerator(app.bedrock_client, cache=None)
+
+    if args.backend == 'local':
+        app.vectors = LocalVectorStore(os.path.join(args.work_dir, 'vector_store'), app.book_catalog)
+    else:
+        byte_fields = ['content_embedding'] if knn_config_from_env()['encoding'] == 'byte' else []
+        app.vectors = OpenSearchVectorStore(client, index='bench_books', user_index='bench_users',
+                                            byte_fields=byte_fields)
+    return app
+
+
+def show_recommendations(app, user_id, live=False):
+    # Everything show_recommendations does for one click, minus the widgets
+    reading_history = app.get_user_reading_history(user_id)
+    if not reading_history:
+        return
+    if live:
+        content_recommendations = app.get_content_recommendations(user_id, reading_history)
+        collab_recommendations = app.get_collaborative_recommendations(user_id)
+        snippets = {}
+    else:
+        content_recommendations, snippets, collab_recommendations = app.get_recommendations(user_id, reading_history)
+    pending = [content_recommendations[i] for i in range(len(content_recommendations)) if i not in snippets]
+    for _ in app.snippets.generate_many(pending):
+        pass
+    return content_recommendations, collab_recommendations
+
+
+def run_online(args, client):
+    app = build_app(args, client)
+    rng = np.random.default_rng(args.seed)
+    user_ids = list(app.data.rentals_by_user)
+    users = [user_ids[i] for i in rng.choice(len(user_ids), size=args.queries, replace=len(user_ids) < args.queries)]
+
+    seed_vectors = {}
+    for user_id in users:
+        history = app.data.user_rentals(user_id)['book_id'].tolist()
+        if history:
+            vectors = app.vectors.get_vectors([history[-1]], 'content_embedding')
+            if vectors:
+                seed_vectors[user_id] = vectors[history[-1]]
+
+    calls = {
+        "get_user_reading_history": lambda user_id: app.get_user_reading_history(user_id),
+        "find_similar_books": lambda user_id: app.find_similar_books(seed_vectors[user_id]),
+        "get_collaborative_recommendations": lambda user_id: app.get_collaborative_recommendations(user_id),
+        "show_recommendations": lambda user_id: show_recommendations(app, user_id),
+        "show_recommendations_live": lambda user_id: show_recommendations(app, user_id, live=True),
+    }
+
+    results = {}
+    for name, call in calls.items():
+        latencies = []
+        for user_id in users:
+            if name == 'find_similar_books' and user_id not in seed_vectors:
+                continue
+            start = time.perf_counter()
+            call(user_id)
+            latencies.append(time.perf_counter() - start)
+        if latencies:
+            results[name] = summarize(latencies)
+            print(f"{name:34} p50={results[name]['p50_ms']:.2f}ms p95={results[name]['p95_ms']:.2f}ms "
+                  f"{results[name]['calls_per_sec']:.0f} calls/sec")
+    return results
+
+
+def run_benchmark(args):
+    timer = StageTimer()
+    client = None
+    if not args.skip_offline:
+        client = run_offline(args, timer)
+    elif args.backend == 'opensearch':
+        from src.process_data import BookRecommendationProcessor
+        processor = BookRecommendationProcessor()
+        if not processor.connect_opensearch():
+            raise SystemExit("Failed to connect to OpenSearch")
+        client = processor.client
+        processor.close()
+
+    online = {} if args.skip_online else run_online(args, client)
+
+    report = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "data_dir": args.data_dir,
+        "backend": args.backend,
+        "fake_embeddings": args.fake_embeddings,
+        "queries": args.queries,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "stages": timer.stages,
+        "online": online,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline processing and online recommendation latency")
+    parser.add_argument('--data-dir', default='data', help="directory with book_catalog.csv and rental_history.csv")
+    parser.add_argument('--backend', choices=['local', 'opensearch'], default='local')
+    parser.add_argument('--work-dir', default='data/benchmark', help="where the local vector store is written")
+    parser.add_argument('--fake-embeddings', action='store_true',
+                        help="use random unit vectors instead of encoding descriptions")
+    parser.add_argument('--embedding-cache', action='store_true', help="allow embedding cache hits while encoding")
+    parser.add_argument('--skip-offline', action='store_true', help="reuse the artifacts of a previous run")
+    parser.add_argument('--skip-online', action='store_true')
+    parser.add_argument('--queries', type=int, default=200, help="students sampled for each online call")
+    parser.add_argument('--bedrock-latency', type=float, default=0.0, help="simulated snippet latency in seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON")
+    run_benchmark(parser.parse_args())
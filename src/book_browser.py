@@ -0,0 +1,127 @@
+import numpy as np
+from opensearchpy import NotFoundError
+
+from src.book_store import VECTOR_FIELDS
+
+# Only what the results table shows; descriptions and vectors are fetched
+# for the one selected book
+LIST_FIELDS = ['book_id', 'title', 'author', 'genre', 'publication_year']
+TEXT_FIELDS = ['title^3', 'author^2', 'description']
+
+
+def book_filters(genres=(), years=None):
+    # Filter clauses shared by the browser and hybrid search; filter context
+    # skips scoring and is cached per segment
+    filters = []
+    if genres:
+        filters.append({"terms": {"genre": list(genres)}})
+    if years:
+        filters.append({"range": {"publication_year": {"gte": int(years[0]), "lte": int(years[1])}}})
+    return filters
+
+
+def catalog_filter_mask(catalog, genres=(), years=None):
+    mask = np.ones(len(catalog), dtype=bool)
+    if genres:
+        mask &= catalog['genre'].isin(list(genres)).to_numpy()
+    if years:
+        year = catalog['publication_year']
+        mask &= ((year >= years[0]) & (year <= years[1])).fillna(False).to_numpy(dtype=bool)
+    return mask
+
+
+class OpenSearchBookBrowser:
+    # Server-side filtered, search_after-paginated book listing
+    def __init__(self, client, index="books"):
+        self.client = client
+        self.index = index
+
+    def build_query(self, text=None, genres=(), years=None):
+        query = {"bool": {"filter": book_filters(genres, years)}}
+        if text:
+            query['bool']['must'] = [{"multi_match": {"query": text, "fields": TEXT_FIELDS}}]
+        return query
+
+    def search(self, text=None, genres=(), years=None, search_after=None, size=25):
+        # Relevance order for text searches, catalog order otherwise; book_id
+        # breaks ties so search_after cursors are stable
+        sort = [{"_score": "desc"}, {"book_id": "asc"}] if text else [{"book_id": "asc"}]
+        body = {
+            "size": size,
+            "query": self.build_query(text, genres, years),
+            "sort": sort,
+            "_source": LIST_FIELDS,
+            "track_total_hits": True,
+        }
+        if search_after:
+            body['search_after'] = search_after
+
+        response = self.client.search(index=self.index, body=body)
+        hits = response['hits']['hits']
+        books = [hit['_source'] for hit in hits]
+        cursor = hits[-1]['sort'] if len(hits) == size else None
+        return books, cursor, response['hits']['total']['value']
+
+    def facets(self):
+        response = self.client.search(index=self.index, body={
+            "size": 0,
+            "aggs": {
+                "genres": {"terms": {"field": "genre", "size": 200}},
+                "min_year": {"min": {"field": "publication_year"}},
+                "max_year": {"max": {"field": "publication_year"}},
+            },
+        })
+        aggs = response['aggregations']
+        genres = sorted(bucket['key'] for bucket in aggs['genres']['buckets'])
+        if aggs['min_year']['value'] is None:
+            return genres, None
+        return genres, (int(aggs['min_year']['value']), int(aggs['max_year']['value']))
+
+    def get_document(self, book_id):
+        try:
+            return self.client.get(index=self.index, id=int(book_id))['_source']
+        except NotFoundError:
+            return None
+
+
+class LocalBookBrowser:
+    # Same interface over the catalog frame and LocalVectorStore (VECTOR_BACKEND=local)
+    def __init__(self, book_catalog, vectors=None):
+        self.catalog = book_catalog.sort_values('book_id', kind='stable').reset_index(drop=True)
+        self.vectors = vectors
+
+    def search(self, text=None, genres=(), years=None, search_after=None, size=25):
+        mask = catalog_filter_mask(self.catalog, genres, years)
+        if text:
+            needle = text.lower()
+            matches = np.zeros(len(self.catalog), dtype=bool)
+            for column in ['title', 'author', 'description']:
+                matches |= self.catalog[column].astype(str).str.lower().str.contains(needle, regex=False).to_numpy()
+            mask &= matches
+        total = int(mask.sum())
+        if search_after:
+            mask &= (self.catalog['book_id'] > search_after[-1]).to_numpy()
+
+        page = self.catalog[mask].head(size)
+        books = page[LIST_FIELDS].to_dict('records')
+        cursor = [int(books[-1]['book_id'])] if len(books) == size else None
+        return books, cursor, total
+
+    def facets(self):
+        genres = sorted(self.catalog['genre'].dropna().astype(str).unique().tolist())
+        if not len(self.catalog):
+            return genres, None
+        return genres, (int(self.catalog['publication_year'].min()), int(self.catalog['publication_year'].max()))
+
+    def get_document(self, book_id):
+        rows = self.catalog[self.catalog['book_id'] == int(book_id)]
+        if not len(rows):
+            return None
+        # Plain Python values so the document renders as JSON
+        doc = {key: value.item() if hasattr(value, 'item') else value for key, value in rows.iloc[0].to_dict().items()}
+        if self.vectors is not None:
+            for field in VECTOR_FIELDS:
+                vector = self.vectors.get_vectors([int(book_id)], field).get(int(book_id))
+                if vector is not None:
+                    doc[field] = np.asarray(vector).tolist()
+        return doc
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+
+from src.metrics import count
+
+BOOK_FIELDS = ['book_id', 'title', 'author', 'isbn', 'description', 'genre', 'publication_year']
+VECTOR_FIELDS = ['content_embedding', 'collaborative_features']
+
+
+class LRUCache:
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def found_docs(response):
+    return {
+        int(doc['_id']): doc['_source']
+        for doc in response['docs']
+        if doc.get('found')
+    }
+
+
+class BookStore:
+    # Batched, projected book lookups: metadata and vectors are fetched with a
+    # single mget each and cached separately, so pages that only show titles
+    # never pull embeddings over the wire
+    def __init__(self, client, index="books", max_entries=10000, ttl=300):
+        self.client = client
+        self.index = index
+        self.docs = LRUCache(max_entries, ttl)
+        self.vectors = LRUCache(max_entries, ttl)
+
+    def mget(self, book_ids, includes):
+        response = self.client.mget(
+            index=self.index,
+            body={"ids": [str(book_id) for book_id in book_ids]},
+            _source_includes=includes,
+        )
+        return found_docs(response)
+
+    def cached_books(self, book_ids):
+        # (cached docs, ids still to fetch) for one lookup
+        books = {}
+        missing = []
+        for book_id in dict.fromkeys(int(book_id) for book_id in book_ids):
+            doc = self.docs.get(book_id)
+            if doc is None:
+                missing.append(book_id)
+            else:
+                books[book_id] = doc
+
+        count('book_cache_lookups_total', len(books), kind='books', result='hit')
+        count('book_cache_lookups_total', len(missing), kind='books', result='miss')
+        return books, missing
+
+    def store_books(self, books, fetched):
+        for book_id, doc in fetched.items():
+            self.docs.put(book_id, doc)
+            books[book_id] = doc
+        return books
+
+    def cached_vectors(self, book_ids, field):
+        vectors = {}
+        missing = []
+        for book_id in dict.fromkeys(int(book_id) for book_id in book_ids):
+            vector = self.vectors.get((book_id, field))
+            if vector is None:
+                missing.append(book_id)
+            else:
+                vectors[book_id] = vector
+
+        count('book_cache_lookups_total', len(vectors), kind='vectors', result='hit')
+        count('book_cache_lookups_total', len(missing), kind='vectors', result='miss')
+        return vectors, missing
+
+    def store_vectors(self, vectors, fetched, field):
+        for book_id, doc in fetched.items():
+            if field in doc:
+                self.vectors.put((book_id, field), doc[field])
+                vectors[book_id] = doc[field]
+        return vectors
+
+    def get_books(self, book_ids):
+        books, missing = self.cached_books(book_ids)
+        if missing:
+            self.store_books(books, self.mget(missing, BOOK_FIELDS))
+        return books
+
+    def get_vectors(self, book_ids, field='content_embedding'):
+        vectors, missing = self.cached_vectors(book_ids, field)
+        if missing:
+            self.store_vectors(vectors, self.mget(missing, [field]), field)
+        return vectors
+
+
+class AsyncBookStore(BookStore):
+    # Same caches and lookups over AsyncOpenSearch; only the mget is awaited
+    async def amget(self, book_ids, includes):
+        response = await self.client.mget(
+            index=self.index,
+            body={"ids": [str(book_id) for book_id in book_ids]},
+            _source_includes=includes,
+        )
+        return found_docs(response)
+
+    async def aget_books(self, book_ids):
+        books, missing = self.cached_books(book_ids)
+        if missing:
+            self.store_books(books, await self.amget(missing, BOOK_FIELDS))
+        return books
+
+    async def aget_vectors(self, book_ids, field='content_embedding'):
+        vectors, missing = self.cached_vectors(book_ids, field)
+        if missing:
+            self.store_vectors(vectors, await self.amget(missing, [field]), field)
+        return vectors
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from opensearchpy import OpenSearch, RequestsHttpConnection, Transport
+
+from src.metrics import current_trace, metrics, request_operation
+from src.snippets import StubBedrockClient
+
+try:
+    from opensearchpy import AsyncOpenSearch, AsyncTransport, AWSV4SignerAsyncAuth
+except ImportError:
+    # AsyncOpenSearch needs aiohttp: pip install "opensearch-py[async]"
+    AsyncOpenSearch = None
+    AsyncTransport = None
+
+# One place that knows how to reach OpenSearch and Bedrock, shared by the app,
+# the processor and the CLIs. Connections are kept alive in per-host pools
+# sized for the thread pools that use them (bulk indexing, snippet workers).
+
+
+def opensearch_settings():
+    return {
+        "host": os.getenv('OPENSEARCH_HOST', 'localhost'),
+        "port": int(os.getenv('OPENSEARCH_PORT', '9200')),
+        "use_ssl": os.getenv('OPENSEARCH_USE_SSL', 'false').lower() == 'true',
+        "region": os.getenv('AWS_REGION', 'us-east-2'),
+        "pool_size": int(os.getenv('OPENSEARCH_POOL_SIZE', '16')),
+        "timeout": float(os.getenv('OPENSEARCH_TIMEOUT', '30')),
+        "max_retries": int(os.getenv('OPENSEARCH_MAX_RETRIES', '2')),
+    }
+
+
+class InstrumentedTransport(Transport):
+    # Every OpenSearch client call goes through perform_request
+    def perform_request(self, method, url, *args, **kwargs):
+        with metrics.span('opensearch_request', operation=request_operation(method, url)):
+            return super().perform_request(method, url, *args, **kwargs)
+
+
+def create_opensearch_client(min_pool_size=0):
+    settings = opensearch_settings()
+    common = {
+        "pool_maxsize": max(settings['pool_size'], min_pool_size),
+        "timeout": settings['timeout'],
+        "max_retries": settings['max_retries'],
+        "retry_on_timeout": True,
+        "transport_class": InstrumentedTransport,
+    }
+
+    if settings['use_ssl']:
+        # AWS managed OpenSearch; AWS4Auth signs requests-based connections
+        from requests_aws4auth import AWS4Auth
+        credentials = boto3.Session().get_credentials()
+        awsauth = AWS4Auth(credentials.access_key, credentials.secret_key, settings['region'], 'es',
+                           session_token=credentials.token)
+        return OpenSearch(
+            hosts=[{'host': settings['host'], 'port': 443}],
+            http_auth=awsauth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=RequestsHttpConnection,
+            **common
+        )
+
+    # Local OpenSearch
+    return OpenSearch(
+        hosts=[{'host': settings['host'], 'port': settings['port']}],
+        use_ssl=False,
+        verify_certs=False,
+        **common
+    )
+
+
+if AsyncTransport is not None:
+    class InstrumentedAsyncTransport(AsyncTransport):
+        async def perform_request(self, method, url, *args, **kwargs):
+            with metrics.span('opensearch_request', operation=request_operation(method, url)):
+                return await super().perform_request(method, url, *args, **kwargs)
+
+
+def create_async_opensearch_client(min_pool_size=0):
+    if AsyncOpenSearch is None:
+        raise RuntimeError('OPENSEARCH_ASYNC=true requires aiohttp (pip install "opensearch-py[async]")')
+
+    settings = opensearch_settings()
+    common = {
+        "maxsize": max(settings['pool_size'], min_pool_size),
+        "timeout": settings['timeout'],
+        "max_retries": settings['max_retries'],
+        "retry_on_timeout": True,
+        "transport_class": InstrumentedAsyncTransport,
+    }
+    if settings['use_ssl']:
+        credentials = boto3.Session().get_credentials()
+        return AsyncOpenSearch(
+            hosts=[{'host': settings['host'], 'port': 443}],
+            http_auth=AWSV4SignerAsyncAuth(credentials, settings['region'], 'es'),
+            use_ssl=True,
+            verify_certs=True,
+            **common
+        )
+    return AsyncOpenSearch(
+        hosts=[{'host': settings['host'], 'port': settings['port']}],
+        use_ssl=False,
+        verify_certs=False,
+        **common
+    )
+
+
+def create_bedrock_client():
+    if os.getenv('BEDROCK_STUB', 'false').lower() == 'true':
+        return StubBedrockClient(latency=float(os.getenv('BEDROCK_STUB_LATENCY', '0')))
+
+    bedrock_timeout = float(os.getenv('BEDROCK_TIMEOUT', '10'))
+    return boto3.client(
+        'bedrock-runtime',
+        region_name=os.getenv('AWS_REGION', 'us-east-2'),
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        config=Config(
+            connect_timeout=bedrock_timeout,
+            read_timeout=bedrock_timeout,
+            retries={'max_attempts': 2},
+            # One pooled connection per snippet worker
+            max_pool_connections=max(10, int(os.getenv('SNIPPET_WORKERS', '5'))),
+        )
+    )
+
+
+class HealthCheck:
+    # Cluster reachability cached for a few seconds, so page renders don't
+    # each spend a round trip on it
+    def __init__(self, ping, ttl=10.0):
+        self.ping = ping
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.healthy = None
+        self.checked_at = 0.0
+
+    def ok(self):
+        with self.lock:
+            if self.healthy is None or time.monotonic() - self.checked_at > self.ttl:
+                try:
+                    self.healthy = bool(self.ping())
+                except Exception:
+                    self.healthy = False
+                self.checked_at = time.monotonic()
+                metrics.count('opensearch_health_checks_total', healthy=self.healthy)
+            return self.healthy
+
+
+class EventLoopThread:
+    # A single long-lived event loop in a daemon thread; synchronous callers
+    # (Streamlit script runs) hand it coroutines and block on the result
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='opensearch-async', daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine, timeout=None):
+        # Spans recorded on the loop still land in the caller's request trace
+        return asyncio.run_coroutine_threadsafe(traced(coroutine, current_trace.get()), self.loop).result(timeout)
+
+
+async def traced(coroutine, trace):
+    token = current_trace.set(trace)
+    try:
+        return await coroutine
+    finally:
+        current_trace.reset(token)
@@ -0,0 +1,56 @@
+import argparse
+import os
+
+from src.library_data import (
+    BOOK_CATALOG_PATH, RENTAL_DATE_COLUMNS, RENTAL_HISTORY_PATH, parquet_path, read_csv_chunked
+)
+
+# Converts the CSVs to typed Parquet files next to them; the app and the
+# processor pick those up automatically (DATA_FORMAT=auto):
+#
+#   python -m src.convert_data
+#   python -m src.convert_data --data-dir data/synthetic/1m
+
+CATALOG_DTYPES = {
+    "book_id": "int64",
+    "title": "string",
+    "author": "string",
+    "isbn": "string",
+    "description": "string",
+    "genre": "category",
+    "publication_year": "Int32",
+}
+RENTAL_DTYPES = {
+    "user_id": "category",
+    "student_name": "category",
+    "book_id": "int64",
+}
+
+
+def convert(csv_path, dtypes, parse_dates=None):
+    frame = read_csv_chunked(csv_path, parse_dates=parse_dates)
+    frame = frame.astype({column: dtype for column, dtype in dtypes.items() if column in frame.columns})
+
+    out_path = parquet_path(csv_path)
+    tmp_path = f"{out_path}.tmp"
+    # Row groups bound how much the streaming processor reads at a time
+    frame.to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False, row_group_size=100000)
+    os.replace(tmp_path, out_path)
+
+    print(f"Wrote {len(frame)} rows to {out_path} "
+          f"({os.path.getsize(csv_path) / 1e6:.1f} MB CSV -> {os.path.getsize(out_path) / 1e6:.1f} MB Parquet)")
+    return out_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert book_catalog.csv and rental_history.csv to Parquet")
+    parser.add_argument('--data-dir', help="directory holding the CSVs (default: the app's data paths)")
+    args = parser.parse_args()
+
+    catalog_path, rental_path = BOOK_CATALOG_PATH, RENTAL_HISTORY_PATH
+    if args.data_dir:
+        catalog_path = os.path.join(args.data_dir, os.path.basename(BOOK_CATALOG_PATH))
+        rental_path = os.path.join(args.data_dir, os.path.basename(RENTAL_HISTORY_PATH))
+
+    convert(catalog_path, CATALOG_DTYPES)
+    convert(rental_path, RENTAL_DTYPES, parse_dates=RENTAL_DATE_COLUMNS)
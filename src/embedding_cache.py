@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+
+class EmbeddingCache:
+    # One directory per model: a raw float32 matrix (memory-mapped on load) plus
+    # a JSON index mapping description hash -> [row, last_used]
+    def __init__(self, model_name, cache_dir='data/embedding_cache'):
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', model_name))
+        self.matrix_path = os.path.join(self.path, 'embeddings.f32')
+        self.index_path = os.path.join(self.path, 'index.json')
+        self.hits = 0
+        self.misses = 0
+        self.dim = None
+        self.rows = {}
+        self.matrix = None
+        # Index changes (new rows, last_used bumps) are kept in memory and
+        # written once by flush()/compact(), not on every encode call
+        self.dirty = False
+        self.load()
+
+    @staticmethod
+    def normalize(text):
+        text = unicodedata.normalize('NFC', str(text))
+        return ' '.join(text.split())
+
+    def key(self, text):
+        return hashlib.sha1(self.normalize(text).encode('utf-8')).hexdigest()
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path) as f:
+            index = json.load(f)
+        self.dim = index['dim']
+        self.rows = index['rows']
+        self.remap()
+
+    def remap(self):
+        count = os.path.getsize(self.matrix_path) // (4 * self.dim) if os.path.exists(self.matrix_path) else 0
+        if count == 0:
+            self.matrix = np.empty((0, self.dim), dtype=np.float32)
+        else:
+            self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(count, self.dim))
+
+    def save_index(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "rows": self.rows}, f)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+    def flush(self):
+        # Rows appended since the last flush are already in the matrix file;
+        # until the index is written they are only unreachable, not corrupt
+        if self.dirty:
+            self.save_index()
+
+    def lookup(self, keys):
+        found = {}
+        now = int(time.time())
+        for i, key in enumerate(keys):
+            entry = self.rows.get(key)
+            if entry is not None and self.matrix is not None and entry[0] < len(self.matrix):
+                entry[1] = now
+                found[i] = entry[0]
+        if found:
+            self.dirty = True
+        return found
+
+    def append(self, keys, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+
+        os.makedirs(self.path, exist_ok=True)
+        start = len(self.matrix) if self.matrix is not None else 0
+        # Drop the read-only mapping before growing the file underneath it
+        self.matrix = None
+        with open(self.matrix_path, 'ab') as f:
+            f.write(embeddings.tobytes())
+
+        now = int(time.time())
+        for offset, key in enumerate(keys):
+            self.rows[key] = [start + offset, now]
+        self.dirty = True
+        self.remap()
+
+    def encode(self, texts, encode_fn):
+        texts = list(texts)
+        keys = [self.key(text) for text in texts]
+        found = self.lookup(keys)
+        self.hits += len(found)
+
+        # Encode each distinct missing description once
+        missing = {}
+        for i, key in enumerate(keys):
+            if i not in found and key not in missing:
+                missing[key] = texts[i]
+        self.misses += len(missing)
+
+        if missing:
+            new_embeddings = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            self.append(list(missing.keys()), new_embeddings)
+
+        if not texts:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        rows = [self.rows[key][0] for key in keys]
+        return np.asarray(self.matrix[rows])
+
+    def compact(self, live_texts=None, max_entries=None, live_keys=None):
+        if self.matrix is None or not self.rows:
+            self.flush()
+            return 0
+
+        entries = self.rows
+        if live_texts is not None:
+            live_keys = set(live_keys or ()) | {self.key(text) for text in live_texts}
+        if live_keys is not None:
+            entries = {key: entry for key, entry in entries.items() if key in live_keys}
+        if max_entries is not None and len(entries) > max_entries:
+            recent = sorted(entries.items(), key=lambda item: item[1][1], reverse=True)[:max_entries]
+            entries = dict(recent)
+
+        evicted = len(self.rows) - len(entries)
+        if evicted == 0 and len(self.matrix) == len(self.rows):
+            self.flush()
+            return 0
+
+        keys = list(entries.keys())
+        kept = np.asarray(self.matrix[[entries[key][0] for key in keys]]) if keys else None
+        self.matrix = None
+
+        tmp_path = f"{self.matrix_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            if kept is not None:
+                f.write(kept.tobytes())
+        os.replace(tmp_path, self.matrix_path)
+
+        self.rows = {key: [row, entries[key][1]] for row, key in enumerate(keys)}
+        self.save_index()
+        self.remap()
+        return evicted
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CachedEncoder:
+    # encode() through an EmbeddingCache for long-running processes (the app's
+    # query encoder): calls are serialized, and the index is written at most
+    # every flush_interval seconds, compacted down to max_entries when over it
+    def __init__(self, encoder, cache, max_entries=None, flush_interval=60):
+        self.encoder = encoder
+        self.cache = cache
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def encode(self, texts):
+        with self.lock:
+            embeddings = self.cache.encode(texts, self.encoder.encode)
+            if time.monotonic() - self.flushed_at >= self.flush_interval:
+                if self.max_entries and len(self.cache.rows) > self.max_entries:
+                    self.cache.compact(max_entries=self.max_entries)
+                else:
+                    self.cache.flush()
+                self.flushed_at = time.monotonic()
+            return embeddings
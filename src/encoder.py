@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+
+from src.metrics import count, span
+
+
+class SentenceEncoder:
+    # backend: "torch" (default), "int8" (dynamic int8 quantization of the Linear
+    # layers) or "onnx" (sentence-transformers ONNX runtime backend). The model
+    # (and torch) is only loaded by the first encode() that needs it.
+    def __init__(self, model_name, workers=1, batch_size=64, backend='torch', onnx_file=None):
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self.identity = model_name if backend == 'torch' else f"{model_name}:{backend}"
+        self.model = None
+        self.pool = None
+        self.sentences = 0
+        self.seconds = 0.0
+
+    def load_model(self, onnx_file):
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == 'onnx':
+            import sentence_transformers
+            version = tuple(int(part) for part in sentence_transformers.__version__.split('.')[:2])
+            if version < (3, 2):
+                raise ImportError(f"ENCODE_BACKEND=onnx needs sentence-transformers 3.2+ "
+                                  f"(installed: {sentence_transformers.__version__})")
+            model_kwargs = {"file_name": onnx_file} if onnx_file else None
+            return SentenceTransformer(self.model_name, backend='onnx', model_kwargs=model_kwargs)
+
+        model = SentenceTransformer(self.model_name, device='cpu' if self.backend == 'int8' else None)
+        if self.backend == 'int8':
+            import torch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def get_model(self):
+        if self.model is None:
+            with span('model_load', backend=self.backend):
+                self.model = self.load_model(self.onnx_file)
+        return self.model
+
+    def encode(self, sentences):
+        sentences = list(sentences)
+        self.get_model()
+        if not sentences:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        start = time.perf_counter()
+        # Sort by length across the whole call so every batch (and every worker
+        # chunk) holds similarly sized sentences and pads as little as possible
+        order = np.argsort([len(sentence) for sentence in sentences], kind='stable')
+        ordered = [sentences[i] for i in order]
+
+        with span('encode', backend=self.backend):
+            if self.workers > 1:
+                if self.pool is None:
+                    self.pool = self.model.start_multi_process_pool(target_devices=['cpu'] * self.workers)
+                chunk_size = max(self.batch_size, -(-len(ordered) // (self.workers * 4)))
+                encoded = self.model.encode_multi_process(
+                    ordered, self.pool, batch_size=self.batch_size, chunk_size=chunk_size
+                )
+            else:
+                encoded = self.model.encode(ordered, batch_size=self.batch_size)
+        count('encoded_sentences_total', len(sentences), backend=self.backend)
+
+        embeddings = np.empty_like(encoded)
+        embeddings[order] = encoded
+
+        self.seconds += time.perf_counter() - start
+        self.sentences += len(sentences)
+        return embeddings
+
+    def throughput(self):
+        return self.sentences / self.seconds if self.seconds > 0 else 0.0
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
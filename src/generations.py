@@ -0,0 +1,56 @@
+import os
+import re
+import shutil
+import time
+
+# Timestamped generations shared by the OpenSearch indexes and the on-disk
+# stores: each rebuild writes a new `{prefix}vYYYYmmddHHMMSS[_N]`, readers are
+# switched over atomically (alias swap or CURRENT file), then older
+# generations beyond the ones to keep are removed.
+
+GENERATION_PATTERN = re.compile(r'v(\d{14})(?:_(\d+))?$')
+
+
+def generation_key(name, prefix=''):
+    match = GENERATION_PATTERN.fullmatch(name[len(prefix):]) if name.startswith(prefix) else None
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2) or 0)
+
+
+def stale_generations(names, live, to_keep, prefix=''):
+    # Oldest first, so _10 sorts after _9; anything not named like a
+    # generation is left alone
+    older = sorted(
+        (name for name in names if name != live and generation_key(name, prefix) is not None),
+        key=lambda name: generation_key(name, prefix)
+    )
+    return older[:max(0, len(older) - (max(1, to_keep) - 1))]
+
+
+def new_generation(names, prefix=''):
+    # Never reuse a name, not even a pruned one: two runs in the same second
+    # would otherwise rewrite the live generation in place or sort out of order
+    stamp = time.strftime('%Y%m%d%H%M%S')
+    suffixes = [key[1] for key in (generation_key(name, prefix) for name in names) if key and key[0] == stamp]
+    if not suffixes:
+        return f"{prefix}v{stamp}"
+    return f"{prefix}v{stamp}_{max(suffixes) + 1}"
+
+
+def new_generation_dir(path):
+    os.makedirs(path, exist_ok=True)
+    generation = new_generation(os.listdir(path))
+    os.makedirs(os.path.join(path, generation))
+    return generation
+
+
+def publish_generation(path, generation, to_keep):
+    # Repoint CURRENT atomically, then drop what no reader can still be opening
+    tmp_path = os.path.join(path, 'CURRENT.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(generation)
+    os.replace(tmp_path, os.path.join(path, 'CURRENT'))
+
+    for name in stale_generations(os.listdir(path), generation, to_keep):
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
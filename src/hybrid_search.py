@@ -0,0 +1,216 @@
+import os
+import re
+
+import numpy as np
+from scipy import sparse
+
+from src.book_browser import book_filters, catalog_filter_mask
+from src.book_store import VECTOR_FIELDS
+from src.index_settings import knn_config_from_env
+from src.metrics import span
+from src.precompute import normalize_rows, top_k
+from src.vector_store import encode_query_vector
+
+# Sub-queries in fusion order: BM25 on the text, k-NN on the text's content
+# embedding, k-NN on the selected student's collaborative factors
+SUB_QUERIES = ('lexical', 'content', 'collaborative')
+LEXICAL_FIELDS = {'title': 2.0, 'description': 1.0}
+# Engines that apply k-NN filters while walking the graph; nmslib can only
+# filter the hits it already found
+FILTERING_ENGINES = ('lucene', 'faiss')
+# OpenSearch's min_max technique scores a lone hit (max == min) as 1
+SINGLE_RESULT_SCORE = 1.0
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def hybrid_weights_from_env():
+    weights = [float(weight) for weight in os.getenv('HYBRID_WEIGHTS', '0.3,0.5,0.2').split(',')]
+    if len(weights) != len(SUB_QUERIES):
+        raise ValueError(f"HYBRID_WEIGHTS needs {len(SUB_QUERIES)} comma-separated weights ({', '.join(SUB_QUERIES)})")
+    return dict(zip(SUB_QUERIES, weights))
+
+
+def normalization_pipeline(weights):
+    # Temporary search pipeline sent with the request (no cluster-side setup):
+    # min-max normalize each sub-query's scores, then take their weighted mean
+    return {
+        "phase_results_processors": [{
+            "normalization-processor": {
+                "normalization": {"technique": "min_max"},
+                "combination": {"technique": "arithmetic_mean", "parameters": {"weights": list(weights)}},
+            }
+        }]
+    }
+
+
+def min_max(scores):
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.full(len(scores), SINGLE_RESULT_SCORE, dtype=np.float32)
+    return (scores - low) / (high - low)
+
+
+class OpenSearchHybridSearch:
+    # Librarian search in one request: a hybrid query whose sub-queries each
+    # carry the genre/year filters, fused by a normalization search pipeline
+    def __init__(self, client, encode=None, vectors=None, index="books", weights=None, knn=None,
+                 byte_fields=(), overfetch=4):
+        self.client = client
+        # encode(list of texts) -> embeddings; None disables the content sub-query
+        self.encode = encode
+        # Any vector store; only get_user_vector is used
+        self.vectors = vectors
+        self.index = index
+        self.weights = weights or hybrid_weights_from_env()
+        self.knn = knn or knn_config_from_env()
+        self.byte_fields = set(byte_fields)
+        self.overfetch = overfetch
+
+    def knn_query(self, field, vector, k, filters):
+        vector = encode_query_vector(field, vector, self.byte_fields)
+
+        if not filters:
+            return {"knn": {field: {"vector": vector, "k": k}}}
+        if self.knn['engine'] in FILTERING_ENGINES:
+            return {"knn": {field: {"vector": vector, "k": k, "filter": {"bool": {"filter": filters}}}}}
+        # Post-filtering on nmslib: over-fetch so k hits usually survive the filter
+        return {"bool": {"must": [{"knn": {field: {"vector": vector, "k": k * self.overfetch}}}], "filter": filters}}
+
+    def build_body(self, text=None, genres=(), years=None, content_vector=None, user_vector=None, k=10):
+        filters = book_filters(genres, years)
+        queries, weights = [], []
+        if text and self.weights['lexical']:
+            fields = [f"{field}^{boost:g}" for field, boost in LEXICAL_FIELDS.items()]
+            queries.append({"bool": {"must": [{"multi_match": {"query": text, "fields": fields}}], "filter": filters}})
+            weights.append(self.weights['lexical'])
+        if content_vector is not None and self.weights['content']:
+            queries.append(self.knn_query('content_embedding', content_vector, k, filters))
+            weights.append(self.weights['content'])
+        if user_vector is not None and self.weights['collaborative']:
+            queries.append(self.knn_query('collaborative_features', user_vector, k, filters))
+            weights.append(self.weights['collaborative'])
+
+        body = {"size": k, "_source": {"excludes": VECTOR_FIELDS}}
+        if not queries:
+            # Nothing to rank by: filtered books in catalog order
+            body['query'] = {"bool": {"filter": filters}}
+            body['sort'] = [{"book_id": "asc"}]
+            return body
+
+        body['query'] = {"hybrid": {"queries": queries}}
+        body['search_pipeline'] = normalization_pipeline(weights)
+        return body
+
+    def search(self, text=None, genres=(), years=None, user_id=None, k=10):
+        text = (text or '').strip() or None
+        content_vector = None
+        if text and self.encode is not None and self.weights['content']:
+            content_vector = self.encode([text])[0]
+        user_vector = None
+        if user_id is not None and self.vectors is not None and self.weights['collaborative']:
+            user_vector = self.vectors.get_user_vector(user_id)
+
+        body = self.build_body(text, genres, years, content_vector, user_vector, k)
+        response = self.client.search(index=self.index, body=body)
+        return [dict(hit['_source'], score=hit['_score']) for hit in response['hits']['hits']]
+
+
+class BM25Index:
+    # In-memory Okapi BM25 (Lucene's defaults) over one text column, as a
+    # term-major sparse matrix so a query only touches its own postings
+    def __init__(self, texts, k1=1.2, b=0.75):
+        self.vocabulary = {}
+        rows, cols = [], []
+        for row, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(str(text).lower()):
+                cols.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                rows.append(row)
+
+        n_docs = len(texts)
+        # Duplicate (row, token) pairs are summed into term frequencies
+        self.postings = sparse.csc_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(n_docs, len(self.vocabulary))
+        )
+        lengths = np.bincount(np.asarray(rows, dtype=np.int64), minlength=n_docs).astype(np.float32)
+        self.k1 = k1
+        self.length_norms = k1 * (1 - b + b * lengths / max(float(lengths.mean()) if n_docs else 0.0, 1.0))
+        doc_freq = np.diff(self.postings.indptr)
+        self.idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+    def scores(self, query):
+        scores = np.zeros(self.postings.shape[0], dtype=np.float32)
+        for token in set(TOKEN_PATTERN.findall(query.lower())):
+            col = self.vocabulary.get(token)
+            if col is None:
+                continue
+            start, end = self.postings.indptr[col], self.postings.indptr[col + 1]
+            rows = self.postings.indices[start:end]
+            tf = self.postings.data[start:end]
+            scores[rows] += self.idf[col] * tf * (self.k1 + 1) / (tf + self.length_norms[rows])
+        return scores
+
+
+class LocalHybridSearch:
+    # Same interface and fusion over LocalVectorStore (VECTOR_BACKEND=local):
+    # each sub-query keeps its k best filtered hits, scores are min-max
+    # normalized per sub-query and combined by weighted arithmetic mean
+    def __init__(self, book_catalog, vectors, encode=None, weights=None):
+        self.vectors = vectors
+        self.encode = encode
+        self.weights = weights or hybrid_weights_from_env()
+        # Catalog rows aligned with the store's matrix rows
+        self.catalog = book_catalog.drop_duplicates('book_id').set_index('book_id').reindex(vectors.book_ids)
+        self.lexical = None
+
+    def lexical_scores(self, text):
+        if self.lexical is None:
+            # Built on the first text search only
+            self.lexical = {
+                field: BM25Index(self.catalog[field].fillna('').tolist()) for field in LEXICAL_FIELDS
+            }
+        return sum(boost * self.lexical[field].scores(text) for field, boost in LEXICAL_FIELDS.items())
+
+    def sub_query_scores(self, text, user_id):
+        scores = []
+        if text and self.weights['lexical']:
+            lexical = self.lexical_scores(text)
+            # Only books containing a query term match the lexical sub-query
+            scores.append((self.weights['lexical'], lexical, lexical > 0))
+        if text and self.encode is not None and self.weights['content']:
+            query = normalize_rows(self.encode([text]))[0]
+            scores.append((self.weights['content'], self.vectors.matrices['content_embedding'] @ query, None))
+        if user_id is not None and self.weights['collaborative']:
+            user_vector = self.vectors.get_user_vector(user_id)
+            if user_vector is not None:
+                matrix = self.vectors.matrices['collaborative_features']
+                scores.append((self.weights['collaborative'], matrix @ np.asarray(user_vector, dtype=np.float32), None))
+        return scores
+
+    def search(self, text=None, genres=(), years=None, user_id=None, k=10):
+        text = (text or '').strip() or None
+        with span('hybrid_search', backend='local'):
+            mask = catalog_filter_mask(self.catalog, genres, years)
+            sub_queries = self.sub_query_scores(text, user_id)
+            if not sub_queries:
+                positions = np.flatnonzero(mask)
+                positions = positions[np.argsort(self.vectors.book_ids[positions], kind='stable')[:k]]
+                return [dict(self.vectors.books[int(self.vectors.book_ids[pos])], score=None) for pos in positions]
+
+            combined = np.zeros(len(mask), dtype=np.float32)
+            matched = np.zeros(len(mask), dtype=bool)
+            for weight, scores, matches in sub_queries:
+                candidates = np.flatnonzero(mask if matches is None else mask & matches)
+                if not len(candidates):
+                    continue
+                hits = candidates[top_k(scores[candidates][None, :], k)[0]]
+                combined[hits] += weight * min_max(scores[hits])
+                matched[hits] = True
+            combined /= sum(weight for weight, _, _ in sub_queries)
+
+            candidates = np.flatnonzero(matched)
+            ranked = candidates[top_k(combined[candidates][None, :], k)[0]] if len(candidates) else candidates
+            return [
+                dict(self.vectors.books[int(self.vectors.book_ids[pos])], score=float(combined[pos]))
+                for pos in ranked
+            ]
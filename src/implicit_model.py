@@ -0,0 +1,289 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.metrics import span
+
+# Implicit-feedback matrix factorization for borrow data. Rentals become a
+# user x book CSR matrix of confidence weights (repeat borrows add up, recent
+# and longer loans count more) and are factorized with ALS (conjugate-gradient
+# solves, vectorized over blocks of users) or BPR (minibatch SGD). Exposes the
+# same pu/qi/n_factors/trainset surface the processor uses for surprise.SVD.
+
+ALGORITHMS = ('als', 'bpr')
+
+
+def rental_weights(rental_history, half_life_days=365, typical_loan_days=14):
+    checkout = pd.to_datetime(rental_history['checkout_date'], errors='coerce')
+    returned = pd.to_datetime(rental_history['return_date'], errors='coerce')
+
+    # Recency relative to the newest rental, so reruns on the same file are stable
+    age_days = (checkout.max() - checkout).dt.days.fillna(0).to_numpy(dtype=np.float32)
+    recency = np.power(np.float32(0.5), age_days / half_life_days)
+
+    # Longer loans read as more engagement; unreturned loans count as typical
+    loan_days = (returned - checkout).dt.days.to_numpy(dtype=np.float32)
+    duration = np.clip(np.nan_to_num(loan_days / typical_loan_days, nan=1.0), 0.5, 2.0)
+    return recency * duration
+
+
+class InteractionSet:
+    # Raw id <-> row/column mapping with the subset of surprise.Trainset's API
+    # the processor relies on
+    def __init__(self, user_ids, item_ids):
+        self.user_ids = list(user_ids)
+        self.item_ids = list(item_ids)
+        self.user_positions = {user_id: pos for pos, user_id in enumerate(self.user_ids)}
+        self.item_positions = {item_id: pos for pos, item_id in enumerate(self.item_ids)}
+
+    def all_users(self):
+        return range(len(self.user_ids))
+
+    def all_items(self):
+        return range(len(self.item_ids))
+
+    def to_raw_uid(self, inner_id):
+        return self.user_ids[inner_id]
+
+    def to_raw_iid(self, inner_id):
+        return self.item_ids[inner_id]
+
+    def to_inner_iid(self, item_id):
+        if item_id not in self.item_positions:
+            raise ValueError(f"Item {item_id} is not part of the trainset")
+        return self.item_positions[item_id]
+
+    def add_users(self, user_ids):
+        added = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in self.user_positions]
+        for user_id in added:
+            self.user_positions[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return added
+
+    def add_items(self, item_ids):
+        added = [item_id for item_id in dict.fromkeys(item_ids) if item_id not in self.item_positions]
+        for item_id in added:
+            self.item_positions[item_id] = len(self.item_ids)
+            self.item_ids.append(item_id)
+        return added
+
+
+def build_interactions(rental_history, half_life_days=365):
+    # Student ids are keyed as strings everywhere, the saved factors included
+    user_codes, user_ids = pd.factorize(rental_history['user_id'].astype(str))
+    item_codes, item_ids = pd.factorize(rental_history['book_id'].astype(int))
+    weights = rental_weights(rental_history, half_life_days)
+
+    # Duplicate (user, book) entries are summed, so repeat borrows weigh more
+    matrix = sparse.csr_matrix(
+        (weights, (user_codes, item_codes)), shape=(len(user_ids), len(item_ids)), dtype=np.float32
+    )
+    matrix.sum_duplicates()
+    return matrix, InteractionSet(user_ids.tolist(), [int(item_id) for item_id in item_ids])
+
+
+class ImplicitFactorModel:
+    def __init__(self, algorithm='als', n_factors=100, iterations=15, regularization=0.01, alpha=40.0,
+                 learning_rate=0.05, cg_steps=3, half_life_days=365, num_threads=0, block_size=4096,
+                 random_state=0):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown collaborative algorithm {algorithm!r}, expected one of {ALGORITHMS}")
+        self.algorithm = algorithm
+        self.n_factors = n_factors
+        self.iterations = iterations
+        self.regularization = regularization
+        self.alpha = alpha
+        self.learning_rate = learning_rate
+        self.cg_steps = cg_steps
+        self.half_life_days = half_life_days
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self.rng = np.random.default_rng(random_state)
+        self.pu = None
+        self.qi = None
+        self.trainset = None
+
+    def initial_factors(self, ids, previous=None):
+        factors = (self.rng.standard_normal((len(ids), self.n_factors)) * 0.01).astype(np.float32)
+        if previous:
+            # Warm start: reuse the last run's vectors for every id seen before
+            for pos, raw_id in enumerate(ids):
+                vector = previous.get(raw_id)
+                if vector is not None and len(vector) == self.n_factors:
+                    factors[pos] = vector
+        return factors
+
+    def fit(self, rental_history, warm_start=None):
+        with span('collaborative_fit', algorithm=self.algorithm):
+            interactions, self.trainset = build_interactions(rental_history, self.half_life_days)
+            warm_start = warm_start or {}
+            self.pu = self.initial_factors(self.trainset.user_ids, warm_start.get('users'))
+            self.qi = self.initial_factors(self.trainset.item_ids, warm_start.get('items'))
+
+            if self.algorithm == 'als':
+                self.fit_als(interactions)
+            else:
+                self.fit_bpr(interactions)
+        return self
+
+    def fit_als(self, interactions):
+        # Confidence c = 1 + alpha * w on observed pairs, preference 1
+        confidence = interactions.copy()
+        confidence.data = (self.alpha * confidence.data).astype(np.float32)
+        transposed = confidence.T.tocsr()
+
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            for _ in range(self.iterations):
+                self.pu = self.als_half_step(confidence, self.pu, self.qi, executor)
+                self.qi = self.als_half_step(transposed, self.qi, self.pu, executor)
+
+    def als_half_step(self, confidence, X, Y, executor):
+        gram = Y.T @ Y + self.regularization * np.eye(self.n_factors, dtype=np.float32)
+        blocks = [
+            (start, min(start + self.block_size, X.shape[0]))
+            for start in range(0, X.shape[0], self.block_size)
+        ]
+        solved = executor.map(lambda block: self.conjugate_gradient(confidence, X, Y, gram, *block), blocks)
+        return np.concatenate(list(solved)) if blocks else X
+
+    def conjugate_gradient(self, confidence, X, Y, gram, start, end, steps=None):
+        # A few warm-started CG steps on (Y'C_uY + reg I) x_u = Y'C_u p_u for a
+        # block of rows at once; every product is a BLAS or sparse matmul
+        block = confidence[start:end]
+        rows = np.repeat(np.arange(end - start), np.diff(block.indptr))
+        cols = block.indices
+        # block holds c - 1 = alpha * w, so C_u p_u has 1 + alpha * w on observed books
+        targets = sparse.csr_matrix((block.data + 1, cols, block.indptr), shape=block.shape) @ Y
+
+        def matvec(P):
+            dots = np.einsum('ij,ij->i', P[rows], Y[cols])
+            weighted = sparse.csr_matrix((block.data * dots, cols, block.indptr), shape=block.shape)
+            return P @ gram + weighted @ Y
+
+        x = X[start:end].copy()
+        r = targets - matvec(x)
+        p = r.copy()
+        rs_old = np.einsum('ij,ij->i', r, r)
+        for _ in range(steps or self.cg_steps):
+            Ap = matvec(p)
+            step = rs_old / np.maximum(np.einsum('ij,ij->i', p, Ap), 1e-10)
+            x += step[:, None] * p
+            r -= step[:, None] * Ap
+            rs_new = np.einsum('ij,ij->i', r, r)
+            p = r + (rs_new / np.maximum(rs_old, 1e-10))[:, None] * p
+            rs_old = rs_new
+        return x.astype(np.float32)
+
+    def fit_bpr(self, interactions, batch_size=10000, iterations=None):
+        # Positives are sampled in proportion to their weight, negatives uniformly
+        coo = interactions.tocoo()
+        # Cumulative weights are built once; each minibatch is a binary search into them
+        cdf = np.cumsum(coo.data, dtype=np.float64)
+        cdf /= cdf[-1]
+        n_items = interactions.shape[1]
+
+        for _ in range(iterations or self.iterations):
+            for _ in range(max(1, -(-coo.nnz // batch_size))):
+                sample = np.minimum(np.searchsorted(cdf, self.rng.random(batch_size), side='right'), coo.nnz - 1)
+                users, positives = coo.row[sample], coo.col[sample]
+                negatives = self.rng.integers(0, n_items, size=batch_size)
+
+                user_vectors = self.pu[users]
+                difference = self.qi[positives] - self.qi[negatives]
+                margin = np.einsum('ij,ij->i', user_vectors, difference)
+                gradient = (1.0 / (1.0 + np.exp(np.clip(margin, -30, 30))))[:, None].astype(np.float32)
+
+                lr, reg = self.learning_rate, self.regularization
+                np.add.at(self.pu, users, lr * (gradient * difference - reg * user_vectors))
+                np.add.at(self.qi, positives, lr * (gradient * user_vectors - reg * self.qi[positives]))
+                np.add.at(self.qi, negatives, lr * (-gradient * user_vectors - reg * self.qi[negatives]))
+
+    def interaction_matrix(self, rental_history):
+        # Weights over the whole history in the current trainset's row/column order;
+        # rentals of students or books the model doesn't know yet are left out
+        rows = rental_history['user_id'].astype(str).map(self.trainset.user_positions).to_numpy(dtype=float)
+        cols = rental_history['book_id'].astype(int).map(self.trainset.item_positions).to_numpy(dtype=float)
+        known = ~(np.isnan(rows) | np.isnan(cols))
+        weights = rental_weights(rental_history, self.half_life_days)[known]
+        matrix = sparse.csr_matrix(
+            (weights, (rows[known].astype(np.int64), cols[known].astype(np.int64))),
+            shape=(len(self.trainset.user_ids), len(self.trainset.item_ids)), dtype=np.float32
+        )
+        matrix.sum_duplicates()
+        return matrix
+
+    def fold_in(self, rental_history, user_ids, item_ids, steps=2, cg_steps=10):
+        # Online update after new rentals: only the given students' and books'
+        # factors are re-fit against the fixed rest of the model. rental_history
+        # must already include the new rentals. Returns the raw ids updated.
+        user_ids = [str(user_id) for user_id in user_ids]
+        with span('collaborative_fold_in', algorithm=self.algorithm):
+            new_users = self.trainset.add_users(user_ids)
+            new_items = self.trainset.add_items(int(item_id) for item_id in item_ids)
+            self.pu = np.concatenate([self.pu, self.initial_factors(new_users)])
+            self.qi = np.concatenate([self.qi, self.initial_factors(new_items)])
+
+            interactions = self.interaction_matrix(rental_history)
+            users = np.array([self.trainset.user_positions[user_id] for user_id in dict.fromkeys(user_ids)],
+                             dtype=np.int64)
+            items = np.array([self.trainset.item_positions[int(item_id)] for item_id in dict.fromkeys(item_ids)],
+                             dtype=np.int64)
+
+            if self.algorithm == 'als':
+                confidence = interactions.copy()
+                confidence.data = (self.alpha * confidence.data).astype(np.float32)
+                transposed = confidence.T.tocsr()
+                identity = self.regularization * np.eye(self.n_factors, dtype=np.float32)
+                for _ in range(steps):
+                    self.pu[users] = self.conjugate_gradient(
+                        confidence[users], self.pu[users], self.qi, self.qi.T @ self.qi + identity,
+                        0, len(users), steps=cg_steps
+                    )
+                    self.qi[items] = self.conjugate_gradient(
+                        transposed[items], self.qi[items], self.pu, self.pu.T @ self.pu + identity,
+                        0, len(items), steps=cg_steps
+                    )
+            else:
+                # A few BPR epochs over the affected students' rentals only
+                mask = np.zeros(interactions.shape[0], dtype=bool)
+                mask[users] = True
+                affected = sparse.diags(mask.astype(np.float32)) @ interactions
+                affected.eliminate_zeros()
+                if affected.nnz:
+                    self.fit_bpr(affected, batch_size=min(10000, affected.nnz), iterations=steps * 25)
+
+        return list(dict.fromkeys(user_ids)), [int(item_id) for item_id in dict.fromkeys(item_ids)]
+
+    def load(self, path):
+        # Factors written by save(), for fold-in updates without a refit
+        with np.load(path) as saved:
+            self.trainset = InteractionSet(saved['user_ids'].tolist(), saved['item_ids'].tolist())
+            self.pu = saved['user_factors'].astype(np.float32)
+            self.qi = saved['item_factors'].astype(np.float32)
+        self.n_factors = self.qi.shape[1]
+        return self
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            user_ids=np.asarray(self.trainset.user_ids, dtype=str),
+            item_ids=np.asarray(self.trainset.item_ids, dtype=np.int64),
+            user_factors=self.pu,
+            item_factors=self.qi,
+        )
+        os.replace(tmp_path, path)
+
+
+def load_factors(path):
+    if not path or not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        return {
+            "users": dict(zip(saved['user_ids'].tolist(), saved['user_factors'])),
+            "items": dict(zip(saved['item_ids'].tolist(), saved['item_factors'])),
+        }
@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+
+KNN_ENGINES = ('nmslib', 'faiss', 'lucene')
+# float: full precision, fp16: faiss scalar quantization, byte: int8 vectors (lucene/faiss)
+VECTOR_ENCODINGS = ('float', 'fp16', 'byte')
+
+
+def knn_config_from_env():
+    return {
+        "engine": os.getenv('KNN_ENGINE', 'nmslib'),
+        "m": int(os.getenv('KNN_M', '0')) or None,
+        "ef_construction": int(os.getenv('KNN_EF_CONSTRUCTION', '0')) or None,
+        "ef_search": int(os.getenv('KNN_EF_SEARCH', '0')) or None,
+        "encoding": os.getenv('KNN_VECTOR_ENCODING', 'float'),
+    }
+
+
+def minimum_opensearch_version(knn):
+    # Oldest OpenSearch whose k-NN plugin accepts the mapping book_index_body
+    # builds for these settings (None: any 2.x)
+    requirements = []
+    if knn['engine'] == 'lucene':
+        # collaborative_features is always an innerproduct field
+        requirements.append(((2, 13), "innerproduct on the lucene engine"))
+    if knn['engine'] == 'faiss' and knn['encoding'] == 'fp16':
+        requirements.append(((2, 13), "faiss fp16 scalar quantization"))
+    if knn['engine'] == 'faiss' and knn['encoding'] == 'byte':
+        requirements.append(((2, 17), "byte vectors on the faiss engine"))
+    return max(requirements) if requirements else (None, None)
+
+
+def parse_version(version):
+    return tuple(int(part) for part in version.split('-')[0].split('.')[:2])
+
+
+def validate_knn_config(knn, server_version=None):
+    if knn['engine'] not in KNN_ENGINES:
+        raise ValueError(f"Unknown k-NN engine {knn['engine']!r}, expected one of {KNN_ENGINES}")
+    if knn['encoding'] not in VECTOR_ENCODINGS:
+        raise ValueError(f"Unknown vector encoding {knn['encoding']!r}, expected one of {VECTOR_ENCODINGS}")
+    if knn['encoding'] == 'fp16' and knn['engine'] != 'faiss':
+        raise ValueError("fp16 vector encoding requires the faiss engine")
+    if knn['encoding'] == 'byte' and knn['engine'] == 'nmslib':
+        raise ValueError("byte vector encoding requires the lucene or faiss engine")
+    if server_version is not None:
+        required, feature = minimum_opensearch_version(knn)
+        if required is not None and parse_version(server_version) < required:
+            raise ValueError(f"{feature} requires OpenSearch {'.'.join(map(str, required))}+, "
+                             f"the cluster runs {server_version}")
+
+
+def knn_field_mapping(dimension, space_type, knn, quantize=False):
+    engine = knn['engine']
+    if engine == 'faiss' and space_type == 'cosinesimil':
+        # Sentence embeddings are unit length, so inner product ranks like cosine
+        space_type = 'innerproduct'
+
+    parameters = {}
+    if knn.get('m'):
+        parameters['m'] = knn['m']
+    if knn.get('ef_construction'):
+        parameters['ef_construction'] = knn['ef_construction']
+    if quantize and knn['encoding'] == 'fp16':
+        parameters['encoder'] = {"name": "sq", "parameters": {"type": "fp16"}}
+
+    method = {"name": "hnsw", "space_type": space_type, "engine": engine}
+    if parameters:
+        method['parameters'] = parameters
+
+    mapping = {"type": "knn_vector", "dimension": dimension, "method": method}
+    if quantize and knn['encoding'] == 'byte':
+        mapping['data_type'] = 'byte'
+    return mapping
+
+
+def book_index_body(knn, content_dimension=384, collaborative_dimension=100):
+    validate_knn_config(knn)
+
+    index = {"knn": True}
+    if knn.get('ef_search') and knn['engine'] != 'lucene':
+        # Lucene derives its search-time beam from k instead
+        index['knn.algo_param.ef_search'] = knn['ef_search']
+
+    return {
+        "settings": {
+            "index": index
+        },
+        "mappings": {
+            "properties": {
+                "book_id": {"type": "integer"},
+                "title": {"type": "text"},
+                "author": {"type": "text"},
+                "isbn": {"type": "keyword"},
+                "description": {"type": "text"},
+                "genre": {"type": "keyword"},
+                "publication_year": {"type": "integer"},
+                # Only the content embedding is quantized; collaborative factors are unbounded
+                "content_embedding": knn_field_mapping(content_dimension, "cosinesimil", knn, quantize=True),
+                # SVD scores a user/book pair by the dot product of their factors
+                "collaborative_features": knn_field_mapping(collaborative_dimension, "innerproduct", knn),
+            }
+        }
+    }
+
+
+def quantize_byte(vector):
+    # Unit-length embeddings scaled into the signed byte range
+    return np.clip(np.rint(np.asarray(vector, dtype=np.float32) * 127), -128, 127).astype(int).tolist()
+
+
+def dequantize_byte(vector):
+    # Back to floats on the unit-length scale quantize_byte started from
+    return np.asarray(vector, dtype=np.float32) / 127
@@ -0,0 +1,171 @@
+import argparse
+import itertools
+import json
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from opensearchpy import helpers
+
+from src.connections import create_opensearch_client
+from src.index_settings import (
+    KNN_ENGINES, VECTOR_ENCODINGS, book_index_body, quantize_byte, validate_knn_config
+)
+from src.library_data import load_embeddings
+from src.precompute import normalize_rows, top_k
+
+load_dotenv()
+
+# Builds scratch copies of the live books index with different k-NN settings
+# and measures recall@k against exact search on the same vectors, plus
+# query latency, so HNSW/engine settings can be picked from measurements:
+#
+#   python -m src.knn_report --engines nmslib faiss lucene --m 16 32 --ef-search 100 256
+
+
+def load_vectors(client, index, field):
+    book_ids = []
+    vectors = []
+    for hit in helpers.scan(client, index=index, _source_includes=['book_id', field]):
+        if field in hit['_source']:
+            book_ids.append(hit['_source']['book_id'])
+            vectors.append(hit['_source'][field])
+    return np.asarray(book_ids, dtype=np.int64), np.asarray(vectors, dtype=np.float32)
+
+
+def exact_neighbors(vectors, queries, field, k):
+    if field == 'content_embedding':
+        vectors, queries = normalize_rows(vectors), normalize_rows(queries)
+    return top_k(queries @ vectors.T, k)
+
+
+def build_scratch_index(client, name, knn, book_ids, field, vectors):
+    body = book_index_body(knn, content_dimension=vectors.shape[1] if field == 'content_embedding' else 384,
+                           collaborative_dimension=vectors.shape[1] if field == 'collaborative_features' else 100)
+    body['mappings']['properties'] = {
+        "book_id": body['mappings']['properties']['book_id'],
+        field: body['mappings']['properties'][field],
+    }
+    client.indices.create(index=name, body=body)
+
+    quantize = field == 'content_embedding' and knn['encoding'] == 'byte'
+    actions = (
+        {
+            "_index": name,
+            "_id": int(book_id),
+            "_source": {"book_id": int(book_id), field: quantize_byte(vector) if quantize else vector.tolist()},
+        }
+        for book_id, vector in zip(book_ids, vectors)
+    )
+    start = time.perf_counter()
+    helpers.bulk(client, actions, chunk_size=500, request_timeout=120)
+    client.indices.refresh(index=name)
+    client.indices.forcemerge(index=name, max_num_segments=1, request_timeout=600)
+    build_seconds = time.perf_counter() - start
+
+    try:
+        client.transport.perform_request('GET', f'/_plugins/_knn/warmup/{name}')
+    except Exception as e:
+        print(f"Warning: k-NN warmup failed for {name}: {e}")
+    return build_seconds
+
+
+def measure(client, name, knn, field, queries, truth, book_ids, k):
+    quantize = field == 'content_embedding' and knn['encoding'] == 'byte'
+    latencies = []
+    took = []
+    recalls = []
+    for query, expected in zip(queries, truth):
+        vector = quantize_byte(query) if quantize else query.tolist()
+        body = {"size": k, "_source": False, "query": {"knn": {field: {"vector": vector, "k": k}}}}
+        start = time.perf_counter()
+        response = client.search(index=name, body=body)
+        latencies.append((time.perf_counter() - start) * 1000)
+        took.append(response['took'])
+        found = {int(hit['_id']) for hit in response['hits']['hits']}
+        recalls.append(len(found & {int(book_ids[pos]) for pos in expected}) / len(expected))
+
+    return {
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "server_p50_ms": float(np.percentile(took, 50)),
+    }
+
+
+def run_report(args):
+    client = create_opensearch_client()
+    server_version = client.info()['version']['number']
+    if args.vectors_dir:
+        # Embeddings saved by the processor; skips scrolling every vector out of the index
+        book_ids, vectors = load_embeddings(args.vectors_dir, args.field)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        source = args.vectors_dir
+    else:
+        book_ids, vectors = load_vectors(client, args.index, args.field)
+        source = args.index
+    if len(vectors) == 0:
+        raise SystemExit(f"No {args.field} vectors found in {source}")
+    print(f"Loaded {len(vectors)} {args.field} vectors from {source}")
+
+    rng = np.random.default_rng(args.seed)
+    sample = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[sample]
+    k = min(args.k, len(vectors))
+    truth = exact_neighbors(vectors, queries, args.field, k)
+
+    results = []
+    for engine, m, ef_construction, encoding in itertools.product(
+            args.engines, args.m, args.ef_construction, args.encodings):
+        knn = {"engine": engine, "m": m, "ef_construction": ef_construction, "ef_search": None, "encoding": encoding}
+        try:
+            validate_knn_config(knn, server_version)
+        except ValueError as e:
+            print(f"Skipping {engine}/{encoding}: {e}")
+            continue
+
+        name = f"{args.index}_knnreport_{engine}_{m}_{ef_construction}_{encoding}".lower()
+        if client.indices.exists(index=name):
+            client.indices.delete(index=name)
+        try:
+            build_seconds = build_scratch_index(client, name, knn, book_ids, args.field, vectors)
+            for ef_search in args.ef_search:
+                if engine != 'lucene':
+                    client.indices.put_settings(index=name, body={"index": {"knn.algo_param.ef_search": ef_search}})
+                row = {
+                    "engine": engine, "m": m, "ef_construction": ef_construction,
+                    "ef_search": ef_search if engine != 'lucene' else None,
+                    "encoding": encoding, "build_s": build_seconds,
+                }
+                row.update(measure(client, name, knn, args.field, queries, truth, book_ids, k))
+                results.append(row)
+                print(f"{engine:7} m={m:<3} efc={ef_construction:<4} efs={row['ef_search'] or '-':<4} "
+                      f"{encoding:5} recall@{k}={row['recall']:.3f} p50={row['p50_ms']:.1f}ms "
+                      f"p95={row['p95_ms']:.1f}ms build={build_seconds:.1f}s")
+                if engine == 'lucene':
+                    break
+        finally:
+            client.indices.delete(index=name)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"field": args.field, "k": k, "queries": len(queries), "results": results}, f, indent=2)
+        print(f"Wrote {args.output}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare k-NN index settings by recall and latency")
+    parser.add_argument('--index', default='books')
+    parser.add_argument('--field', default='content_embedding', choices=['content_embedding', 'collaborative_features'])
+    parser.add_argument('--engines', nargs='+', default=['nmslib'], choices=KNN_ENGINES)
+    parser.add_argument('--m', nargs='+', type=int, default=[16])
+    parser.add_argument('--ef-construction', nargs='+', type=int, default=[128])
+    parser.add_argument('--ef-search', nargs='+', type=int, default=[100])
+    parser.add_argument('--encodings', nargs='+', default=['float'], choices=VECTOR_ENCODINGS)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--vectors-dir', help="read content embeddings saved by the processor (e.g. data/artifacts)")
+    parser.add_argument('--output', help="write the results as JSON")
+    run_report(parser.parse_args())
@@ -0,0 +1,129 @@
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.metrics import count, span
+from src.rental_analytics import RentalAnalytics
+
+RENTAL_HISTORY_PATH = 'data/rental_history.csv'
+BOOK_CATALOG_PATH = 'data/book_catalog.csv'
+
+RENTAL_DATE_COLUMNS = ['checkout_date', 'return_date']
+# Student ids are labels: always strings, so numeric ids match the str keys of
+# saved factors, the users index and the local vector store
+ID_DTYPES = {"user_id": str, "student_name": str}
+
+
+def parquet_path(path):
+    return os.path.splitext(path)[0] + '.parquet'
+
+
+def resolve_source(path):
+    # A .parquet written by `python -m src.convert_data` next to the CSV is
+    # preferred (DATA_FORMAT=auto), unless DATA_FORMAT=csv or pyarrow is missing
+    data_format = os.getenv('DATA_FORMAT', 'auto').lower()
+    if path.endswith('.parquet') or data_format == 'csv':
+        return path
+    candidate = parquet_path(path)
+    # pyarrow itself is only imported once a Parquet file is actually read
+    if os.path.exists(candidate) and importlib.util.find_spec('pyarrow') is not None:
+        return candidate
+    if data_format == 'parquet':
+        raise FileNotFoundError(f"DATA_FORMAT=parquet but {candidate} is missing or pyarrow is not installed")
+    return path
+
+
+def read_csv_chunked(path, **kwargs):
+    # Columns are typed/parsed chunk by chunk so the raw strings never exist for the whole file
+    chunk_size = int(os.getenv('CSV_CHUNK_SIZE', '100000'))
+    kwargs.setdefault('dtype', ID_DTYPES)
+    return pd.concat(pd.read_csv(path, chunksize=chunk_size, **kwargs), ignore_index=True)
+
+
+def string_ids(frame):
+    # Parquet files converted before ids were read as strings hold numbers
+    for column in ID_DTYPES:
+        if column not in frame.columns:
+            continue
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            if not all(isinstance(value, str) for value in frame[column].cat.categories):
+                frame[column] = frame[column].cat.rename_categories(str)
+        elif not pd.api.types.is_string_dtype(frame[column]) and not pd.api.types.is_object_dtype(frame[column]):
+            frame[column] = frame[column].astype(str)
+    return frame
+
+
+def read_table(path, columns=None, parse_dates=None):
+    # Parquet columns are already typed and memory-mapped, and only the
+    # requested columns are read; CSV falls back to chunked parsing
+    path = resolve_source(path)
+    with span('data_load', file=os.path.basename(path)):
+        if path.endswith('.parquet'):
+            frame = string_ids(pd.read_parquet(path, columns=columns, memory_map=True))
+        else:
+            if parse_dates and columns is not None:
+                parse_dates = [column for column in parse_dates if column in columns]
+            frame = read_csv_chunked(path, usecols=columns, parse_dates=parse_dates or None)
+    count('data_rows_total', len(frame), file=os.path.basename(path))
+    return frame
+
+
+def iter_table_chunks(path, chunk_size, columns=None):
+    path = resolve_source(path)
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_size, columns=columns):
+            yield string_ids(batch.to_pandas())
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=columns, dtype=ID_DTYPES):
+            yield chunk
+
+
+def source_mtimes(*paths):
+    return tuple(os.path.getmtime(resolve_source(path)) for path in paths)
+
+
+def save_embeddings(directory, book_ids, embeddings, name='content_embedding'):
+    # Raw .npy next to the tables, loadable with mmap_mode='r'
+    os.makedirs(directory, exist_ok=True)
+    for file_name, array in [(f"{name}.npy", np.asarray(embeddings, dtype=np.float32)),
+                             ('book_ids.npy', np.asarray(book_ids, dtype=np.int64))]:
+        tmp_path = os.path.join(directory, f"{file_name}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(directory, file_name))
+
+
+def load_embeddings(directory, name='content_embedding'):
+    current_path = os.path.join(directory, 'CURRENT')
+    if os.path.exists(current_path):
+        # A versioned store (e.g. data/artifacts): read its current version
+        with open(current_path) as f:
+            directory = os.path.join(directory, f.read().strip())
+    book_ids = np.load(os.path.join(directory, 'book_ids.npy'))
+    embeddings = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+    return book_ids, embeddings
+
+
+class LibraryData:
+    # Pre-parsed catalog and rental frames plus lookup indexes, built once per
+    # version of the source files and shared by every page render
+    def __init__(self, rental_path=RENTAL_HISTORY_PATH, catalog_path=BOOK_CATALOG_PATH):
+        self.rental_history = read_table(rental_path, parse_dates=RENTAL_DATE_COLUMNS)
+        self.book_catalog = read_table(catalog_path)
+
+        # Ensure book_id columns have consistent data types
+        self.rental_history['book_id'] = self.rental_history['book_id'].astype(int)
+        self.book_catalog['book_id'] = self.book_catalog['book_id'].astype(int)
+
+        # user_id -> row positions in rental_history, in file order
+        self.rentals_by_user = self.rental_history.groupby('user_id', sort=False, observed=True).indices
+        self.analytics = RentalAnalytics(self.rental_history, self.book_catalog)
+
+    def user_rentals(self, user_id):
+        positions = self.rentals_by_user.get(user_id)
+        if positions is None:
+            return self.rental_history.iloc[0:0]
+        return self.rental_history.iloc[positions]
@@ -0,0 +1,175 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Process-wide timing spans and counters. Every span feeds a Prometheus-style
+# histogram, is logged as one JSON line when METRICS_LOG=true, and is appended
+# to the current request trace (if any) for the app's debug panel.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger('read_to_succeed.metrics')
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.log_spans = os.getenv('METRICS_LOG', 'false').lower() == 'true'
+
+    def count(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    @contextmanager
+    def span(self, name, **labels):
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            yield labels
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(f"{name}_seconds", seconds, **labels)
+            if status == 'error':
+                self.count(f"{name}_errors_total", **labels)
+
+            trace = current_trace.get()
+            if trace is not None:
+                trace.append({
+                    "span": name,
+                    "labels": labels,
+                    "start_ms": (start - trace.start) * 1000,
+                    "duration_ms": seconds * 1000,
+                    "status": status,
+                })
+            if self.log_spans:
+                logger.info(json.dumps({
+                    "span": name, "duration_ms": round(seconds * 1000, 3), "status": status, **labels
+                }, default=str))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: dict(value, buckets=list(value['buckets'])) for key, value in self.histograms.items()}
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (metric, key), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(key)} {value}")
+
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, key), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram['buckets']):
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{format_labels(key)} {histogram['sum']:.6f}")
+                lines.append(f"{name}_count{format_labels(key)} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port):
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        return server
+
+
+class RequestTrace(list):
+    def __init__(self):
+        super().__init__()
+        self.start = time.perf_counter()
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+@contextmanager
+def request_trace():
+    trace = RequestTrace()
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+def submit_in_context(executor, fn, *args):
+    # Worker threads don't inherit context variables; carry the trace along
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def request_operation(method, url):
+    # "_search", "_bulk", "_doc", ... or the HTTP method for bare index URLs
+    return next((part for part in reversed(url.split('?')[0].split('/')) if part.startswith('_')), method)
+
+
+metrics = MetricsRegistry()
+span = metrics.span
+count = metrics.count
+
+
+if metrics.log_spans and not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
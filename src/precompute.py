@@ -0,0 +1,140 @@
+import numpy as np
+
+# Must match the app's live path: last 3 rentals seed content recommendations,
+# per-seed rankings are merged with reciprocal rank fusion
+HISTORY_SEEDS = 3
+RRF_K = 60
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores, k, chunk_columns=None):
+    # Row-wise top-k column indices in descending score order. Partitions are
+    # taken per column chunk and merged, so the index arrays argpartition
+    # allocates stay at rows x chunk_columns instead of the whole matrix.
+    n = scores.shape[1]
+    k = min(k, n)
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+
+    chunk_columns = max(k, chunk_columns or n)
+    candidates = []
+    for start in range(0, n, chunk_columns):
+        chunk = scores[:, start:start + chunk_columns]
+        width = chunk.shape[1]
+        kk = min(k, width)
+        # The kk largest end up last; no negated copy of the chunk
+        part = np.argpartition(chunk, width - kk, axis=1)[:, width - kk:]
+        candidates.append(part + start)
+    part = np.concatenate(candidates, axis=1) if len(candidates) > 1 else candidates[0]
+    values = np.take_along_axis(scores, part, axis=1)
+    if part.shape[1] > k:
+        keep = np.argpartition(values, part.shape[1] - k, axis=1)[:, part.shape[1] - k:]
+        part = np.take_along_axis(part, keep, axis=1)
+        values = np.take_along_axis(values, keep, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1)
+
+
+class RecommendationPrecomputer:
+    def __init__(self, book_ids, content_embeddings, item_factors=None, num_recommendations=5,
+                 memory_mb=512, block_size=None):
+        self.book_ids = np.asarray(book_ids, dtype=np.int64)
+        self.positions = {int(book_id): pos for pos, book_id in enumerate(self.book_ids)}
+        self.content = normalize_rows(content_embeddings)
+        self.item_factors = None if item_factors is None else np.asarray(item_factors, dtype=np.float32)
+        self.num_recommendations = num_recommendations
+        # Score rows (one per seed book) whose float32 scores fit the budget;
+        # top_k's per-chunk index arrays add at most as much again
+        n_books = max(1, len(self.book_ids))
+        score_rows = max(HISTORY_SEEDS, int(memory_mb * 1024 * 1024 // (n_books * 4)))
+        self.block_size = block_size or max(1, score_rows // HISTORY_SEEDS)
+        self.chunk_columns = max(num_recommendations, n_books // 2)
+
+    def user_histories(self, rental_history):
+        histories = {}
+        for user_id, book_ids in rental_history.groupby('user_id', sort=False, observed=True)['book_id']:
+            book_ids = [int(book_id) for book_id in book_ids]
+            histories[user_id] = {
+                "rental_count": len(book_ids),
+                "history_book_ids": book_ids[-HISTORY_SEEDS:],
+                "read": sorted({self.positions[b] for b in book_ids if b in self.positions}),
+            }
+        return histories
+
+    def content_block(self, users, histories):
+        seed_rows = []
+        seed_owner = []
+        for u, user_id in enumerate(users):
+            for book_id in histories[user_id]['history_book_ids']:
+                if book_id in self.positions:
+                    seed_rows.append(self.positions[book_id])
+                    seed_owner.append(u)
+        if not seed_rows:
+            return {user_id: [] for user_id in users}
+
+        scores = self.content[seed_rows] @ self.content.T
+        for row, u in enumerate(seed_owner):
+            scores[row, histories[users[u]]['read']] = -np.inf
+        ranked = top_k(scores, self.num_recommendations, self.chunk_columns)
+
+        fused = [{} for _ in users]
+        best = [{} for _ in users]
+        for row, u in enumerate(seed_owner):
+            seed_book_id = int(self.book_ids[seed_rows[row]])
+            for rank, pos in enumerate(ranked[row]):
+                if not np.isfinite(scores[row, pos]):
+                    break
+                book_id = int(self.book_ids[pos])
+                fused[u][book_id] = fused[u].get(book_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+                if book_id not in best[u] or rank < best[u][book_id][0]:
+                    best[u][book_id] = (rank, seed_book_id)
+
+        results = {}
+        for u, user_id in enumerate(users):
+            ordered = sorted(fused[u], key=lambda book_id: (-fused[u][book_id], book_id))
+            results[user_id] = [
+                {"book_id": book_id, "seed_book_id": best[u][book_id][1]}
+                for book_id in ordered[:self.num_recommendations]
+            ]
+        return results
+
+    def collaborative_block(self, users, histories, user_factors):
+        known = [user_id for user_id in users if user_id in user_factors]
+        results = {user_id: [] for user_id in users}
+        if not known or self.item_factors is None:
+            return results
+
+        scores = np.stack([user_factors[user_id] for user_id in known]).astype(np.float32) @ self.item_factors.T
+        for row, user_id in enumerate(known):
+            scores[row, histories[user_id]['read']] = -np.inf
+        ranked = top_k(scores, self.num_recommendations, self.chunk_columns)
+
+        for row, user_id in enumerate(known):
+            results[user_id] = [
+                int(self.book_ids[pos]) for pos in ranked[row] if np.isfinite(scores[row, pos])
+            ]
+        return results
+
+    def compute(self, rental_history, user_factors=None):
+        histories = self.user_histories(rental_history)
+        users = list(histories)
+        recommendations = {}
+
+        for start in range(0, len(users), self.block_size):
+            block = users[start:start + self.block_size]
+            content = self.content_block(block, histories)
+            collaborative = self.collaborative_block(block, histories, user_factors or {})
+            for user_id in block:
+                recommendations[user_id] = {
+                    "rental_count": histories[user_id]['rental_count'],
+                    "history_book_ids": histories[user_id]['history_book_ids'],
+                    "content_recommendations": content[user_id],
+                    "collaborative_recommendations": collaborative[user_id],
+                }
+        return recommendations
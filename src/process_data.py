@@ -1,203 +1,1068 @@
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from surprise import Dataset, Reader, SVD
-from surprise.model_selection import train_test_split
-from opensearchpy import OpenSearch
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import argparse
+import hashlib
 import json
 import os
-import boto3
-from requests_aws4auth import AWS4Auth
+import time
+from queue import Queue, Full
 from dotenv import load_dotenv
 
+from src.artifacts import ARTIFACTS_PATH, DEPENDENTS, ArtifactStore
+from src.convert_data import RENTAL_DTYPES, convert
+from src.embedding_cache import EmbeddingCache
+from src.encoder import SentenceEncoder
+from src.generations import new_generation, stale_generations
+from src.index_settings import book_index_body, knn_config_from_env, quantize_byte, validate_knn_config
+from src.library_data import (
+    BOOK_CATALOG_PATH, RENTAL_DATE_COLUMNS, RENTAL_HISTORY_PATH, iter_table_chunks, read_table, resolve_source
+)
+from src.metrics import metrics, span
+from src.precompute import RecommendationPrecomputer
+from src.snippets import FallbackSnippet, SnippetCache, SnippetGenerator
+
+# surprise, scipy, boto3, opensearch-py and the sentence-transformers model are
+# imported or loaded by the stages that use them, so e.g. --only index never
+# touches the encoder and a bad OpenSearch endpoint fails before any model load
+
 load_dotenv()
 
+# Columns whose changes require a book to be re-embedded and re-indexed
+BOOK_CONTENT_COLUMNS = ['book_id', 'title', 'author', 'isbn', 'description', 'genre', 'publication_year']
+RENTAL_COLUMNS = ['user_id', 'book_id', 'checkout_date', 'return_date']
+# Processing stages in pipeline order (--only embed,collab,...)
+STAGES = ('embed', 'collab', 'precompute', 'index')
+# Which stage produces each artifact bundle entry
+ARTIFACT_STAGES = {
+    "content_embedding": "embed",
+    "collaborative_features": "collab",
+    "user_factors": "collab",
+    "recommendations": "precompute",
+}
+
 class BookRecommendationProcessor:
     def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model_name = 'all-MiniLM-L6-v2'
+        self.encoder = SentenceEncoder(
+            self.model_name,
+            workers=int(os.getenv('ENCODE_WORKERS', '1')),
+            batch_size=int(os.getenv('ENCODE_BATCH_SIZE', '64')),
+            backend=os.getenv('ENCODE_BACKEND', 'torch'),
+            onnx_file=os.getenv('ENCODE_ONNX_FILE'),
+        )
+        # Opened by the first stage that encodes, since loading its index is not free
+        self.use_embedding_cache = os.getenv('EMBEDDING_CACHE', 'true').lower() == 'true'
+        self.embedding_cache_dir = os.getenv('EMBEDDING_CACHE_DIR', 'data/embedding_cache')
+        self.embedding_cache = None
+        self.embedding_cache_max_entries = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '0')) or None
         self.client = None
-        self.collaborative_model = SVD()
+        self.book_catalog_path = BOOK_CATALOG_PATH
+        self.rental_history_path = RENTAL_HISTORY_PATH
+        self.artifacts = ArtifactStore(
+            os.getenv('ARTIFACTS_PATH', ARTIFACTS_PATH),
+            versions_to_keep=int(os.getenv('ARTIFACT_VERSIONS_TO_KEEP', '2')),
+        )
+        # svd (explicit-rating SVD from surprise), or als / bpr on implicit borrow weights
+        self.collaborative_trainer = os.getenv('COLLABORATIVE_TRAINER', 'svd').lower()
+        self.collaborative_factors_path = os.getenv('COLLABORATIVE_FACTORS_PATH', 'data/collaborative_factors.npz')
+        # Alternating fold-in passes per batch of ingested rentals (src.rental_ingest)
+        self.fold_in_steps = int(os.getenv('COLLABORATIVE_FOLD_IN_STEPS', '2'))
+        self.ingest_history = None
+        self.ingest_book_ids = None
+        self.ingest_names = None
+        # Width of collaborative_features; the model itself is created on first use
+        self.collaborative_dimension = 100
+        self.collaborative_model = None
+        self.trainset = None
+        
+        self.index_alias = "books"
+        self.knn = knn_config_from_env()
+        validate_knn_config(self.knn)
+        self.user_index_alias = "users"
+        self.index_generations_to_keep = max(1, int(os.getenv('INDEX_GENERATIONS_TO_KEEP', '2')))
+        
+        self.precompute = os.getenv('PRECOMPUTE_RECOMMENDATIONS', 'true').lower() == 'true'
+        self.precompute_top_n = int(os.getenv('PRECOMPUTE_TOP_N', '5'))
+        # Score matrix budget per block of students (peak is about twice this)
+        self.precompute_memory_mb = int(os.getenv('PRECOMPUTE_MEMORY_MB', '512'))
+        self.precompute_snippets = os.getenv('PRECOMPUTE_SNIPPETS', 'false').lower() == 'true'
+        
+        self.vector_backend = os.getenv('VECTOR_BACKEND', 'opensearch').lower()
+        self.vector_store_path = os.getenv('VECTOR_STORE_PATH', 'data/vector_store')
+        self.vector_store_export = os.getenv('VECTOR_STORE_EXPORT', 'false').lower() == 'true'
+        self.vector_store_hnsw = os.getenv('VECTOR_STORE_HNSW', 'false').lower() == 'true'
+        
+        self.manifest_path = os.getenv('PROCESSING_MANIFEST', 'data/processing_manifest.json')
+        
+        self.stream_chunk_size = int(os.getenv('STREAM_CHUNK_SIZE', '1000'))
+        self.stream_queue_size = int(os.getenv('STREAM_QUEUE_SIZE', '2'))
+        
+        self.bulk_indexing = os.getenv('BULK_INDEXING', 'true').lower() == 'true'
+        self.bulk_chunk_size = int(os.getenv('BULK_CHUNK_SIZE', '500'))
+        self.bulk_max_in_flight = int(os.getenv('BULK_MAX_IN_FLIGHT', '4'))
+        self.bulk_max_retries = int(os.getenv('BULK_MAX_RETRIES', '5'))
+        self.bulk_initial_backoff = float(os.getenv('BULK_INITIAL_BACKOFF', '1.0'))
+        self.bulk_max_backoff = float(os.getenv('BULK_MAX_BACKOFF', '30.0'))
         
     def connect_opensearch(self):
-        host = os.getenv('OPENSEARCH_HOST', 'localhost')
-        port = int(os.getenv('OPENSEARCH_PORT', '9200'))
-        use_ssl = os.getenv('OPENSEARCH_USE_SSL', 'false').lower() == 'true'
-        
-        if use_ssl:
-            # AWS managed OpenSearch
-            region = os.getenv('AWS_REGION', 'us-east-2')
-            credentials = boto3.Session().get_credentials()
-            awsauth = AWS4Auth(credentials.access_key, credentials.secret_key, region, 'es', session_token=credentials.token)
-            
-            self.client = OpenSearch(
-                hosts=[{'host': host, 'port': 443}],
-                http_auth=awsauth,
-                use_ssl=True,
-                verify_certs=True,
-                connection_class=None,
-            )
-        else:
-            # Local OpenSearch
-            self.client = OpenSearch(
-                hosts=[{'host': host, 'port': port}],
-                use_ssl=False,
-                verify_certs=False,
-            )
+        from src.connections import create_opensearch_client
+        
+        # Enough pooled connections for every in-flight bulk request
+        self.client = create_opensearch_client(min_pool_size=self.bulk_max_in_flight + 2)
         
         try:
             info = self.client.info()
             print(f"Connected to OpenSearch: {info['version']['number']}")
-            return True
         except Exception as e:
             print(f"Connection failed: {e}")
             return False
+        
+        try:
+            # Fail before any work if the cluster can't create the configured index
+            validate_knn_config(self.knn, info['version']['number'])
+        except ValueError as e:
+            print(f"Unsupported k-NN settings: {e}")
+            return False
+        return True
     
     def create_index(self):
+        index_settings = book_index_body(self.knn)
+        
+        index_name = self.generation_name(self.index_alias)
+        self.client.indices.create(index=index_name, body=index_settings)
+        print(f"Created {index_name} index")
+        return index_name
+    
+    def create_user_index(self):
         index_settings = {
-            "settings": {
-                "index": {
-                    "knn": True,
-                }
-            },
             "mappings": {
+                # Precomputed recommendation lists are only stored, never searched
+                "dynamic": False,
                 "properties": {
-                    "book_id": {"type": "integer"},
-                    "title": {"type": "text"},
-                    "author": {"type": "text"},
-                    "isbn": {"type": "keyword"},
-                    "description": {"type": "text"},
-                    "genre": {"type": "keyword"},
-                    "publication_year": {"type": "integer"},
-                    "content_embedding": {
-                        "type": "knn_vector",
-                        "dimension": 384,
-                        "method": {
-                            "name": "hnsw",
-                            "space_type": "cosinesimil",
-                            "engine": "nmslib"
-                        }
-                    },
-                    "collaborative_features": {
-                        "type": "knn_vector",
-                        "dimension": 100,
-                        "method": {
-                            "name": "hnsw",
-                            "space_type": "cosinesimil",
-                            "engine": "nmslib"
-                        }
-                    }
+                    "user_id": {"type": "keyword"},
+                    # Only ever read back by id as a kNN query vector
+                    "collaborative_features": {"type": "float", "index": False, "doc_values": False}
                 }
             }
         }
         
-        if self.client.indices.exists(index="books"):
-            self.client.indices.delete(index="books")
+        index_name = self.generation_name(self.user_index_alias)
+        self.client.indices.create(index=index_name, body=index_settings)
+        print(f"Created {index_name} index")
+        return index_name
+    
+    def generation_name(self, alias):
+        # Each rebuild gets its own generation; readers keep using the alias
+        existing = self.client.indices.get(index=f"{alias}_v*")
+        return new_generation(existing, prefix=f"{alias}_")
+    
+    def warm_index(self, index_name):
+        self.client.indices.refresh(index=index_name)
+        try:
+            self.client.transport.perform_request('GET', f'/_plugins/_knn/warmup/{index_name}')
+            print(f"Warmed k-NN graphs for {index_name}")
+        except Exception as e:
+            print(f"Warning: k-NN warmup failed for {index_name}: {e}")
+    
+    def swap_aliases(self, generations):
+        # Books and users switch over together in a single atomic update
+        actions = []
+        for alias, index_name in generations.items():
+            if self.client.indices.exists_alias(name=alias):
+                for old_index in self.client.indices.get_alias(name=alias):
+                    actions.append({"remove": {"index": old_index, "alias": alias}})
+            elif self.client.indices.exists(index=alias):
+                # Concrete index left over from before aliases were used
+                actions.append({"remove_index": {"index": alias}})
+            actions.append({"add": {"index": index_name, "alias": alias}})
+        
+        self.client.indices.update_aliases(body={"actions": actions})
+        for alias, index_name in generations.items():
+            print(f"Alias {alias} now points to {index_name}")
+    
+    def prune_old_indexes(self, live_index, alias):
+        response = self.client.indices.get(index=f"{alias}_v*")
+        stale = stale_generations(response, live_index, self.index_generations_to_keep, prefix=f"{alias}_")
         
-        self.client.indices.create(index="books", body=index_settings)
-        print("Created books index")
+        for index_name in stale:
+            self.client.indices.delete(index=index_name)
+            print(f"Deleted old index generation {index_name}")
     
     def load_data(self):
-        book_catalog = pd.read_csv('data/book_catalog.csv')
-        rental_history = pd.read_csv('data/rental_history.csv')
-        return book_catalog, rental_history
+        book_catalog = read_table(self.book_catalog_path, columns=BOOK_CONTENT_COLUMNS)
+        return book_catalog, self.load_rental_history()
+    
+    def load_rental_history(self):
+        # Only the columns the collaborative model and manifest need
+        return read_table(self.rental_history_path, columns=RENTAL_COLUMNS)
+    
+    def iter_catalog_chunks(self):
+        for chunk in iter_table_chunks(self.book_catalog_path, self.stream_chunk_size, columns=BOOK_CONTENT_COLUMNS):
+            # Embedding rows are looked up by position within the chunk
+            yield chunk.reset_index(drop=True)
+    
+    def book_hashes(self, book_catalog):
+        hashes = pd.util.hash_pandas_object(book_catalog[BOOK_CONTENT_COLUMNS], index=False)
+        return {str(book_id): str(h) for book_id, h in zip(book_catalog['book_id'], hashes)}
+    
+    def rental_fingerprint(self, rental_history):
+        # Same rentals, same hash, whether they came from the CSV (date strings)
+        # or from Parquet (typed dates, categorical ids)
+        rentals = pd.DataFrame({
+            'user_id': rental_history['user_id'].astype(str),
+            'book_id': rental_history['book_id'].astype('int64'),
+        })
+        for column in RENTAL_DATE_COLUMNS:
+            rentals[column] = pd.to_datetime(rental_history[column]).astype('datetime64[ns]')
+        hashes = pd.util.hash_pandas_object(rentals[RENTAL_COLUMNS], index=False)
+        return hashlib.sha256(hashes.values.tobytes()).hexdigest()
+    
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            return json.load(f)
+    
+    def save_manifest(self, book_catalog, rental_history):
+        self.write_manifest(self.book_hashes(book_catalog), self.rental_fingerprint(rental_history))
+    
+    def write_manifest(self, book_hashes, rental_fingerprint):
+        manifest = {
+            "model": self.encoder.identity,
+            "books": book_hashes,
+            "rental_fingerprint": rental_fingerprint,
+        }
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def get_embedding_cache(self):
+        if self.embedding_cache is None and self.use_embedding_cache:
+            # Quantized backends produce slightly different vectors, so they get their own cache
+            self.embedding_cache = EmbeddingCache(self.encoder.identity, self.embedding_cache_dir)
+        return self.embedding_cache
     
     def generate_content_embeddings(self, book_catalog):
         descriptions = book_catalog['description'].tolist()
-        embeddings = self.model.encode(descriptions)
+        cache = self.get_embedding_cache()
+        if cache is None:
+            return self.encode(descriptions)
+        
+        embeddings = cache.encode(descriptions, self.encode)
+        stats = cache.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
         return embeddings
     
-    def generate_collaborative_embeddings(self, rental_history, book_catalog):
-        reader = Reader(rating_scale=(1, 5))
-        rental_history['rating'] = 4.0
-        
-        data = Dataset.load_from_df(
-            rental_history[['user_id', 'book_id', 'rating']], 
-            reader
+    def encode(self, descriptions):
+        embeddings = self.encoder.encode(descriptions)
+        print(f"Encoded {len(descriptions)} descriptions "
+              f"({self.encoder.throughput():.0f} sentences/sec overall)")
+        return embeddings
+    
+    def close(self):
+        self.encoder.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
+        metrics_file = os.getenv('METRICS_FILE')
+        if metrics_file:
+            metrics.write(metrics_file)
+            print(f"Wrote metrics to {metrics_file}")
+    
+    def compact_embedding_cache(self, book_catalog=None, live_keys=None):
+        cache = self.get_embedding_cache()
+        if cache is None:
+            return
+        live_texts = book_catalog['description'].tolist() if book_catalog is not None else None
+        evicted = cache.compact(
+            live_texts, max_entries=self.embedding_cache_max_entries, live_keys=live_keys
         )
-        
-        trainset = data.build_full_trainset()
-        self.collaborative_model.fit(trainset)
+        if evicted:
+            print(f"Evicted {evicted} stale embedding cache entries")
+    
+    def get_collaborative_model(self):
+        if self.collaborative_model is None:
+            if self.collaborative_trainer == 'svd':
+                from surprise import SVD
+                self.collaborative_model = SVD(n_factors=self.collaborative_dimension)
+            else:
+                from src.implicit_model import ImplicitFactorModel
+                self.collaborative_model = ImplicitFactorModel(
+                    algorithm=self.collaborative_trainer,
+                    n_factors=self.collaborative_dimension,
+                    iterations=int(os.getenv('COLLABORATIVE_ITERATIONS', '15')),
+                    regularization=float(os.getenv('COLLABORATIVE_REGULARIZATION', '0.01')),
+                    alpha=float(os.getenv('COLLABORATIVE_ALPHA', '40')),
+                    half_life_days=float(os.getenv('COLLABORATIVE_HALF_LIFE_DAYS', '365')),
+                    num_threads=int(os.getenv('COLLABORATIVE_THREADS', '0')),
+                )
+        return self.collaborative_model
+    
+    def generate_collaborative_embeddings(self, rental_history, book_catalog=None):
+        model = self.get_collaborative_model()
+        if self.collaborative_trainer == 'svd':
+            from surprise import Dataset, Reader
+            
+            reader = Reader(rating_scale=(1, 5))
+            rental_history['rating'] = 4.0
+            
+            data = Dataset.load_from_df(
+                rental_history[['user_id', 'book_id', 'rating']], 
+                reader
+            )
+            
+            trainset = data.build_full_trainset()
+            with span('svd_fit'):
+                model.fit(trainset)
+        else:
+            from src.implicit_model import load_factors
+            
+            # Warm-started from the previous run's factors, so refits converge in fewer iterations
+            start = time.perf_counter()
+            model.fit(rental_history, warm_start=load_factors(self.collaborative_factors_path))
+            model.save(self.collaborative_factors_path)
+            trainset = model.trainset
+            print(f"Fit {self.collaborative_trainer} factors in {time.perf_counter() - start:.1f}s")
+        self.trainset = trainset
         
         book_factors = {}
+        if book_catalog is None:
+            # Streaming mode: books without rentals fall back to zeros at indexing time
+            for inner_id in trainset.all_items():
+                book_factors[trainset.to_raw_iid(inner_id)] = model.qi[inner_id]
+            return book_factors
+        
         for book_id in book_catalog['book_id']:
             try:
                 inner_id = trainset.to_inner_iid(book_id)
-                book_factors[book_id] = self.collaborative_model.qi[inner_id]
+                book_factors[book_id] = model.qi[inner_id]
             except ValueError:
-                book_factors[book_id] = np.zeros(self.collaborative_model.n_factors)
+                book_factors[book_id] = np.zeros(self.collaborative_dimension)
         
         # Ensure no None values
         for book_id, factors in book_factors.items():
             if factors is None:
-                book_factors[book_id] = np.zeros(self.collaborative_model.n_factors)
+                book_factors[book_id] = np.zeros(self.collaborative_dimension)
         
         return book_factors
     
-    def index_books(self, book_catalog, content_embeddings, collaborative_factors):
-        for idx, row in book_catalog.iterrows():
-            collab_features = collaborative_factors.get(row['book_id'])
-            if collab_features is None or not isinstance(collab_features, np.ndarray):
-                print(f"Warning: Using default features for book_id {row['book_id']}")
-                collab_features = np.zeros(self.collaborative_model.n_factors)
+    def generate_user_factors(self):
+        model = self.collaborative_model
+        return {
+            self.trainset.to_raw_uid(inner_id): np.nan_to_num(model.pu[inner_id], nan=0.0)
+            for inner_id in self.trainset.all_users()
+        }
+    
+    def iter_user_actions(self, user_factors, recommendations=None):
+        for user_id, factors in user_factors.items():
+            doc = {"user_id": str(user_id), "collaborative_features": factors.tolist()}
+            if recommendations is not None and user_id in recommendations:
+                doc.update(recommendations[user_id])
+            yield "index", str(user_id), doc
+    
+    def precompute_recommendations(self, book_catalog, rental_history, content_embeddings,
+                                   collaborative_factors, user_factors):
+        if not self.precompute:
+            return None
+        
+        start = time.perf_counter()
+        precomputer = RecommendationPrecomputer(
+            book_catalog['book_id'],
+            content_embeddings,
+            self.item_factor_matrix(book_catalog, collaborative_factors),
+            num_recommendations=self.precompute_top_n,
+            memory_mb=self.precompute_memory_mb,
+        )
+        recommendations = precomputer.compute(rental_history, user_factors)
+        print(f"Precomputed recommendations for {len(recommendations)} students "
+              f"in {time.perf_counter() - start:.1f}s")
+        
+        if self.precompute_snippets:
+            self.attach_snippets(recommendations, book_catalog)
+        return recommendations
+    
+    def item_factor_matrix(self, book_catalog, collaborative_factors):
+        zeros = np.zeros(self.collaborative_dimension)
+        return np.stack([
+            np.nan_to_num(collaborative_factors.get(book_id, zeros), nan=0.0) for book_id in book_catalog['book_id']
+        ])
+    
+    def export_local_store(self, book_catalog, content_embeddings, collaborative_factors,
+                           user_factors, recommendations):
+        from src.vector_store import write_local_store
+        
+        start = time.perf_counter()
+        path = write_local_store(
+            self.vector_store_path,
+            book_catalog['book_id'],
+            {
+                "content_embedding": content_embeddings,
+                "collaborative_features": self.item_factor_matrix(book_catalog, collaborative_factors),
+            },
+            user_factors,
+            user_documents=recommendations,
+            build_hnsw=self.vector_store_hnsw,
+            generations_to_keep=self.index_generations_to_keep,
+        )
+        print(f"Wrote local vector store {path} in {time.perf_counter() - start:.1f}s")
+    
+    def connect_bedrock(self):
+        from src.connections import create_bedrock_client
+        return create_bedrock_client()
+    
+    def attach_snippets(self, recommendations, book_catalog):
+        print("Generating recommendation snippets...")
+        books = {int(book['book_id']): book for book in book_catalog[BOOK_CONTENT_COLUMNS].to_dict('records')}
+        generator = SnippetGenerator(
+            self.connect_bedrock(),
+            cache=SnippetCache(os.getenv('SNIPPET_CACHE_PATH', 'data/snippet_cache.sqlite3')),
+            max_workers=int(os.getenv('SNIPPET_WORKERS', '5')),
+            timeout=float(os.getenv('BEDROCK_TIMEOUT', '10')),
+        )
+        
+        fallbacks = 0
+        for user_recommendations in recommendations.values():
+            content = user_recommendations['content_recommendations']
+            pairs = [(books[rec['seed_book_id']], books[rec['book_id']]) for rec in content]
+            for i, snippet in generator.generate_many(pairs):
+                if isinstance(snippet, FallbackSnippet):
+                    # Left out so the app generates it live instead of showing the fallback forever
+                    fallbacks += 1
+                    continue
+                content[i]['snippet'] = snippet
+        if fallbacks:
+            print(f"Skipped {fallbacks} snippets that fell back after Bedrock errors or timeouts")
+    
+    def build_book_doc(self, row, content_embedding, collaborative_factors):
+        collab_features = collaborative_factors.get(row['book_id'])
+        if collab_features is None or not isinstance(collab_features, np.ndarray):
+            print(f"Warning: Using default features for book_id {row['book_id']}")
+            collab_features = np.zeros(self.collaborative_dimension)
+        
+        # Ensure collab_features is not None and convert to list
+        if collab_features is not None and hasattr(collab_features, 'tolist'):
+            # Check for NaN values and replace them
+            if np.any(np.isnan(collab_features)):
+                print(f"Warning: Found NaN values in collab_features for book_id {row['book_id']}")
+                collab_features = np.nan_to_num(collab_features, nan=0.0)
+            collab_list = collab_features.tolist()
             
-            # Ensure collab_features is not None and convert to list
-            if collab_features is not None and hasattr(collab_features, 'tolist'):
-                # Check for NaN values and replace them
-                if np.any(np.isnan(collab_features)):
-                    print(f"Warning: Found NaN values in collab_features for book_id {row['book_id']}")
-                    collab_features = np.nan_to_num(collab_features, nan=0.0)
-                collab_list = collab_features.tolist()
-                
-                # Final check to ensure no None values in list
-                if any(x is None for x in collab_list):
-                    print(f"Warning: Found None in collab_list for book_id {row['book_id']}")
-                    collab_list = [0.0 if x is None else x for x in collab_list]
+            # Final check to ensure no None values in list
+            if any(x is None for x in collab_list):
+                print(f"Warning: Found None in collab_list for book_id {row['book_id']}")
+                collab_list = [0.0 if x is None else x for x in collab_list]
+        else:
+            print(f"Error: collab_features is {type(collab_features)} for book_id {row['book_id']}")
+            collab_list = np.zeros(self.collaborative_dimension).tolist()
+        
+        return {
+            "book_id": int(row['book_id']),
+            "title": row['title'],
+            "author": row['author'],
+            "isbn": row['isbn'],
+            "description": row['description'],
+            "genre": row['genre'],
+            "publication_year": int(row['publication_year']),
+            "content_embedding": self.encode_content_vector(content_embedding),
+            "collaborative_features": collab_list
+        }
+    
+    def encode_content_vector(self, content_embedding):
+        if self.knn['encoding'] == 'byte':
+            return quantize_byte(content_embedding)
+        return content_embedding.tolist()
+    
+    def iter_book_docs(self, book_catalog, content_embeddings, collaborative_factors):
+        # Plain dict rows; iterrows builds a Series per book
+        for idx, row in enumerate(book_catalog[BOOK_CONTENT_COLUMNS].to_dict('records')):
+            doc = self.build_book_doc(row, content_embeddings[idx], collaborative_factors)
+            yield int(row['book_id']), doc
+    
+    def index_books(self, book_catalog, content_embeddings, collaborative_factors, index_name="books"):
+        for book_id, doc in self.iter_book_docs(book_catalog, content_embeddings, collaborative_factors):
+            self.client.index(index=index_name, id=book_id, body=doc)
+        
+        print(f"Indexed {len(book_catalog)} books")
+    
+    def prepare_bulk_load(self, index_name):
+        response = self.client.indices.get_settings(index=index_name)
+        current = next(iter(response.values()))['settings']['index']
+        previous = {
+            "refresh_interval": current.get('refresh_interval', '1s'),
+            "number_of_replicas": current.get('number_of_replicas', '1'),
+        }
+        
+        # Segment refreshes and replica writes only slow down a full load
+        self.client.indices.put_settings(
+            index=index_name,
+            body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}}
+        )
+        return previous
+    
+    def finish_bulk_load(self, index_name, previous_settings):
+        self.client.indices.put_settings(index=index_name, body={"index": previous_settings})
+        self.client.indices.refresh(index=index_name)
+    
+    def send_bulk_chunk(self, index_name, chunk):
+        from opensearchpy import ConnectionError as OpenSearchConnectionError
+        from opensearchpy import TransportError
+        
+        pending = chunk
+        failed = 0
+        
+        for attempt in range(self.bulk_max_retries + 1):
+            body = []
+            for op_type, book_id, source in pending:
+                body.append({op_type: {"_index": index_name, "_id": book_id}})
+                if source is not None:
+                    body.append(source)
+            
+            retry = []
+            try:
+                response = self.client.bulk(body=body)
+            except (OpenSearchConnectionError, TransportError) as e:
+                if isinstance(e, OpenSearchConnectionError) or e.status_code == 429:
+                    retry = pending
+                else:
+                    raise
             else:
-                print(f"Error: collab_features is {type(collab_features)} for book_id {row['book_id']}")
-                collab_list = np.zeros(self.collaborative_model.n_factors).tolist()
+                if not response['errors']:
+                    return failed
+                
+                for action, item in zip(pending, response['items']):
+                    op_type = action[0]
+                    status = item[op_type]['status']
+                    if status == 429 or status >= 500:
+                        retry.append(action)
+                    elif status == 404 and op_type == "delete":
+                        continue
+                    elif status >= 300:
+                        failed += 1
+                        print(f"Error in {op_type} for book_id {action[1]}: {item[op_type].get('error')}")
             
-            doc = {
-                "book_id": int(row['book_id']),
-                "title": row['title'],
-                "author": row['author'],
-                "isbn": row['isbn'],
-                "description": row['description'],
-                "genre": row['genre'],
-                "publication_year": int(row['publication_year']),
-                "content_embedding": content_embeddings[idx].tolist(),
-                "collaborative_features": collab_list
-            }
+            if not retry:
+                return failed
             
-            self.client.index(index="books", id=row['book_id'], body=doc)
+            pending = retry
+            if attempt < self.bulk_max_retries:
+                backoff = min(self.bulk_max_backoff, self.bulk_initial_backoff * (2 ** attempt))
+                print(f"Retrying {len(pending)} bulk actions in {backoff:.1f}s")
+                time.sleep(backoff)
         
-        print(f"Indexed {len(book_catalog)} books")
+        print(f"Giving up on {len(pending)} bulk actions after {self.bulk_max_retries} retries")
+        return failed + len(pending)
+    
+    def iter_chunks(self, actions, chunk_size):
+        chunk = []
+        for action in actions:
+            chunk.append(action)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
+    def bulk_index_docs(self, actions, index_name="books", bulk_load=True):
+        start = time.perf_counter()
+        total = 0
+        failed = 0
+        
+        # Refresh/replica tuning is only safe on an index that is not serving yet
+        previous_settings = self.prepare_bulk_load(index_name) if bulk_load else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.bulk_max_in_flight) as executor:
+                in_flight = set()
+                for chunk in self.iter_chunks(actions, self.bulk_chunk_size):
+                    # Bound the number of chunks held in memory / on the wire
+                    if len(in_flight) >= self.bulk_max_in_flight:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        failed += sum(future.result() for future in done)
+                    
+                    total += len(chunk)
+                    in_flight.add(executor.submit(self.send_bulk_chunk, index_name, chunk))
+                
+                failed += sum(future.result() for future in in_flight)
+        finally:
+            if bulk_load:
+                self.finish_bulk_load(index_name, previous_settings)
+            else:
+                self.client.indices.refresh(index=index_name)
+        
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else 0.0
+        print(f"Bulk applied {total - failed}/{total} actions in {elapsed:.1f}s ({rate:.0f} docs/sec)")
+        return total - failed, failed
+    
+    def bulk_index_books(self, book_catalog, content_embeddings, collaborative_factors, index_name="books"):
+        actions = (
+            ("index", book_id, doc)
+            for book_id, doc in self.iter_book_docs(book_catalog, content_embeddings, collaborative_factors)
+        )
+        return self.bulk_index_docs(actions, index_name=index_name)
     
     def process_all(self):
-        print("Starting data processing...")
+        return self.process_stages(STAGES)
+    
+    def process_stages(self, stages):
+        # Runs the selected stages in pipeline order. Inputs that no selected
+        # stage produces come from the current artifact bundle, and everything
+        # produced is saved to it as a new version for later runs.
+        stages = [stage for stage in STAGES if stage in stages]
+        print(f"Starting data processing ({', '.join(stages)})...")
+        
+        # Connect before touching data or models, so a bad endpoint fails in seconds
+        if 'index' in stages and self.vector_backend != 'local':
+            if not self.connect_opensearch():
+                print("Failed to connect to OpenSearch")
+                return
+            print("Connected to OpenSearch")
+        
+        book_catalog = read_table(self.book_catalog_path, columns=BOOK_CONTENT_COLUMNS)
+        rental_history = None
+        if 'collab' in stages or 'precompute' in stages:
+            rental_history = self.load_rental_history()
+            print(f"Loaded {len(book_catalog)} books and {len(rental_history)} rental records")
+        else:
+            print(f"Loaded {len(book_catalog)} books")
+        
+        produced = {}
+        if 'embed' in stages:
+            print("Generating content embeddings...")
+            produced['content_embedding'] = self.generate_content_embeddings(book_catalog)
+        if 'collab' in stages:
+            print("Generating collaborative embeddings...")
+            collaborative_factors = self.generate_collaborative_embeddings(rental_history, book_catalog)
+            produced['collaborative_features'] = self.item_factor_matrix(book_catalog, collaborative_factors)
+            produced['user_factors'] = self.generate_user_factors()
+        
+        artifacts = dict(produced)
+        if 'precompute' in stages or 'index' in stages:
+            required = [name for name in ('content_embedding', 'collaborative_features', 'user_factors')
+                        if name not in artifacts]
+            # Recommendations are only reused when this run neither recomputes
+            # them nor rebuilds what they were computed from
+            optional = []
+            if 'precompute' not in stages and self.precompute and not any(
+                    'recommendations' in DEPENDENTS.get(name, ()) for name in produced):
+                optional.append('recommendations')
+            loaded = self.load_artifacts(book_catalog, required, optional)
+            if loaded is None:
+                return
+            artifacts.update(loaded)
+        
+        if 'precompute' in stages:
+            recommendations = self.precompute_recommendations(
+                book_catalog, rental_history, artifacts['content_embedding'],
+                self.factor_dict(book_catalog, artifacts['collaborative_features']), artifacts['user_factors']
+            )
+            if recommendations is not None:
+                produced['recommendations'] = artifacts['recommendations'] = recommendations
+        
+        if produced:
+            self.save_artifacts(book_catalog, produced, rental_history)
+        
+        if 'index' in stages:
+            collaborative_factors = self.factor_dict(book_catalog, artifacts['collaborative_features'])
+            if self.vector_backend == 'local':
+                self.export_local_store(
+                    book_catalog, artifacts['content_embedding'], collaborative_factors,
+                    artifacts['user_factors'], artifacts.get('recommendations')
+                )
+            else:
+                self.index_artifacts(
+                    book_catalog, artifacts['content_embedding'], collaborative_factors,
+                    artifacts['user_factors'], artifacts.get('recommendations')
+                )
+        
+        if 'embed' in stages:
+            self.compact_embedding_cache(book_catalog)
+        
+        print("Data processing complete!")
+    
+    def factor_dict(self, book_catalog, factor_matrix):
+        # book_id -> row of a matrix in catalog order, as the indexing helpers expect
+        return dict(zip(book_catalog['book_id'].astype(int).tolist(), factor_matrix))
+    
+    def load_artifacts(self, book_catalog, required, optional=()):
+        if not required and not optional:
+            return {}
+        bundle = self.artifacts.current()
+        missing = [name for name in required if bundle is None or not bundle.has(name)]
+        if missing:
+            stages = sorted({ARTIFACT_STAGES[name] for name in missing}, key=STAGES.index)
+            print(f"No saved {', '.join(missing)} in {self.artifacts.path}, "
+                  f"run with --only {','.join(stages)} (or without --only) first")
+            return None
+        
+        names = list(required) + [name for name in optional if bundle is not None and bundle.has(name)]
+        if not names:
+            return {}
+        if not np.array_equal(bundle.book_ids(), book_catalog['book_id'].to_numpy(dtype=np.int64)):
+            print(f"Artifact bundle {bundle.version} was built for a different catalog, "
+                  f"run with --only embed,collab (or without --only) first")
+            return None
+        if 'content_embedding' in names:
+            if bundle.manifest['artifacts']['content_embedding'].get('model') != self.encoder.identity:
+                print(f"Warning: artifact bundle {bundle.version} embeddings were made with "
+                      f"{bundle.manifest['artifacts']['content_embedding'].get('model')}, not {self.encoder.identity}")
+            # Edited descriptions keep the same book_ids but make the embeddings stale
+            embedded = bundle.book_hashes()
+            if embedded is None:
+                print(f"Artifact bundle {bundle.version} has no book content hashes, run with --only embed first")
+                return None
+            changed = [book_id for book_id, h in self.book_hashes(book_catalog).items() if embedded.get(book_id) != h]
+            if changed:
+                print(f"{len(changed)} books changed since artifact bundle {bundle.version} was embedded "
+                      f"(e.g. book_id {', '.join(changed[:5])}), run with --only embed first")
+                return None
+        
+        print(f"Reusing {', '.join(names)} from artifact bundle {bundle.version}")
+        return {name: bundle.load(name) for name in names}
+    
+    def save_artifacts(self, book_catalog, produced, rental_history=None):
+        rental_fingerprint = self.rental_fingerprint(rental_history) if rental_history is not None else None
+        artifact_meta = {}
+        for name in produced:
+            if name == 'content_embedding':
+                artifact_meta[name] = {"model": self.encoder.identity}
+            elif name in ('collaborative_features', 'user_factors'):
+                artifact_meta[name] = {"trainer": self.collaborative_trainer, "rental_fingerprint": rental_fingerprint}
+            else:
+                artifact_meta[name] = {"rental_fingerprint": rental_fingerprint}
+        
+        start = time.perf_counter()
+        bundle = self.artifacts.write(
+            book_catalog['book_id'], produced, artifact_meta, base=self.artifacts.current(),
+            book_hashes=self.book_hashes(book_catalog) if 'content_embedding' in produced else None
+        )
+        print(f"Saved {', '.join(produced)} to artifact bundle {bundle.path} in {time.perf_counter() - start:.1f}s")
+        return bundle
+    
+    def index_artifacts(self, book_catalog, content_embeddings, collaborative_factors, user_factors,
+                        recommendations=None):
+        index_name = self.create_index()
+        user_index_name = self.create_user_index()
+        
+        try:
+            print("Indexing books...")
+            if self.bulk_indexing:
+                self.bulk_index_books(book_catalog, content_embeddings, collaborative_factors, index_name=index_name)
+            else:
+                self.index_books(book_catalog, content_embeddings, collaborative_factors, index_name=index_name)
+            
+            print("Indexing user factors...")
+            self.bulk_index_docs(self.iter_user_actions(user_factors, recommendations), index_name=user_index_name)
+            
+            self.warm_index(index_name)
+        except Exception:
+            # Never leave a half-built generation behind; the aliases still serve the old one
+            print(f"Processing failed, deleting partial indexes {index_name}, {user_index_name}")
+            self.client.indices.delete(index=f"{index_name},{user_index_name}")
+            raise
+        
+        self.swap_aliases({self.index_alias: index_name, self.user_index_alias: user_index_name})
+        self.prune_old_indexes(index_name, self.index_alias)
+        self.prune_old_indexes(user_index_name, self.user_index_alias)
+        # What the indexed vectors were actually built from (not the live
+        # catalog and rentals), so --incremental fixes anything that changed since
+        bundle = self.artifacts.current()
+        self.write_manifest(
+            bundle.book_hashes(),
+            bundle.manifest['artifacts']['collaborative_features'].get('rental_fingerprint')
+        )
+        
+        if self.vector_store_export:
+            self.export_local_store(
+                book_catalog, content_embeddings, collaborative_factors, user_factors, recommendations
+            )
+    
+    def process_streaming(self):
+        if self.vector_backend == 'local':
+            print("Streaming mode only supports OpenSearch, running a full local build")
+            return self.process_all()
+        
+        print("Starting streaming data processing...")
         
         if not self.connect_opensearch():
             print("Failed to connect to OpenSearch")
             return
         
-        print("Connected to OpenSearch")
+        index_name = self.create_index()
+        user_index_name = self.create_user_index()
         
-        self.create_index()
+        try:
+            rental_history = self.load_rental_history()
+            print(f"Loaded {len(rental_history)} rental records")
+            
+            print("Generating collaborative embeddings...")
+            collaborative_factors = self.generate_collaborative_embeddings(rental_history)
+            # Precomputed recommendations need the full embedding matrix, which streaming never holds
+            self.bulk_index_docs(self.iter_user_actions(self.generate_user_factors()), index_name=user_index_name)
+            
+            book_hashes = {}
+            live_keys = set()
+            chunks = Queue(maxsize=self.stream_queue_size)
+            
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # Indexing drains the queue while the next chunk is being encoded
+                indexer = executor.submit(self.bulk_index_docs, self.iter_queued_actions(chunks), index_name)
+                try:
+                    for chunk in self.iter_catalog_chunks():
+                        print(f"Encoding chunk of {len(chunk)} books...")
+                        content_embeddings = self.generate_content_embeddings(chunk)
+                        book_hashes.update(self.book_hashes(chunk))
+                        if self.get_embedding_cache() is not None:
+                            live_keys.update(self.embedding_cache.key(text) for text in chunk['description'])
+                        
+                        actions = [
+                            ("index", book_id, doc)
+                            for book_id, doc in self.iter_book_docs(chunk, content_embeddings, collaborative_factors)
+                        ]
+                        self.put_chunk(chunks, actions, indexer)
+                finally:
+                    self.put_chunk(chunks, None, indexer)
+                indexer.result()
+            
+            self.warm_index(index_name)
+        except Exception:
+            print(f"Processing failed, deleting partial indexes {index_name}, {user_index_name}")
+            self.client.indices.delete(index=f"{index_name},{user_index_name}")
+            raise
+        
+        self.swap_aliases({self.index_alias: index_name, self.user_index_alias: user_index_name})
+        self.prune_old_indexes(index_name, self.index_alias)
+        self.prune_old_indexes(user_index_name, self.user_index_alias)
+        self.write_manifest(book_hashes, self.rental_fingerprint(rental_history))
+        self.compact_embedding_cache(live_keys=live_keys)
+        
+        print("Streaming processing complete!")
+    
+    def iter_queued_actions(self, chunks):
+        while True:
+            actions = chunks.get()
+            if actions is None:
+                return
+            yield from actions
+    
+    def put_chunk(self, chunks, actions, indexer):
+        while True:
+            try:
+                chunks.put(actions, timeout=1)
+                return
+            except Full:
+                if indexer.done():
+                    # Surface the indexer's error instead of blocking forever
+                    indexer.result()
+                    return
+    
+    def process_incremental(self):
+        if self.vector_backend == 'local':
+            # Unchanged descriptions still come from the embedding cache
+            print("Incremental mode only supports OpenSearch, running a full local build")
+            return self.process_all()
+        
+        print("Starting incremental data processing...")
+        
+        manifest = self.load_manifest()
+        if manifest is None or manifest.get('model') != self.encoder.identity:
+            print("No usable manifest found, running a full rebuild")
+            return self.process_all()
+        
+        if not self.connect_opensearch():
+            print("Failed to connect to OpenSearch")
+            return
+        
+        for alias in (self.index_alias, self.user_index_alias):
+            if not self.client.indices.exists(index=alias):
+                print(f"Index {alias} does not exist, running a full rebuild")
+                return self.process_all()
         
         book_catalog, rental_history = self.load_data()
         print(f"Loaded {len(book_catalog)} books and {len(rental_history)} rental records")
         
-        print("Generating content embeddings...")
-        content_embeddings = self.generate_content_embeddings(book_catalog)
+        previous_hashes = manifest['books']
+        current_hashes = self.book_hashes(book_catalog)
+        changed_mask = [previous_hashes.get(book_id) != h for book_id, h in current_hashes.items()]
+        changed_books = book_catalog[changed_mask].reset_index(drop=True)
+        removed_ids = [int(book_id) for book_id in previous_hashes if book_id not in current_hashes]
+        rentals_changed = self.rental_fingerprint(rental_history) != manifest['rental_fingerprint']
         
-        print("Generating collaborative embeddings...")
-        collaborative_factors = self.generate_collaborative_embeddings(rental_history, book_catalog)
-        print(f"Sample collaborative factors: {list(collaborative_factors.items())[:3]}")
+        print(f"{len(changed_books)} new or changed books, {len(removed_ids)} removed, "
+              f"rental history {'changed' if rentals_changed else 'unchanged'}")
         
-        print("Indexing books...")
-        self.index_books(book_catalog, content_embeddings, collaborative_factors)
+        content_embeddings = None
+        if len(changed_books):
+            print("Generating content embeddings for changed books...")
+            content_embeddings = self.generate_content_embeddings(changed_books)
         
-        print("Data processing complete!")
+        collaborative_factors = {}
+        if rentals_changed:
+            print("Refitting collaborative model...")
+            collaborative_factors = self.generate_collaborative_embeddings(rental_history, book_catalog)
+        
+        actions = self.iter_incremental_actions(
+            book_catalog, changed_books, content_embeddings, collaborative_factors, removed_ids, rentals_changed
+        )
+        self.bulk_index_docs(actions, index_name=self.index_alias, bulk_load=False)
+        if rentals_changed:
+            user_factors = self.generate_user_factors()
+            recommendations = None
+            if self.precompute:
+                # Unchanged descriptions come straight from the embedding cache
+                recommendations = self.precompute_recommendations(
+                    book_catalog, rental_history, self.generate_content_embeddings(book_catalog),
+                    collaborative_factors, user_factors
+                )
+            self.bulk_index_docs(
+                self.iter_user_actions(user_factors, recommendations), index_name=self.user_index_alias, bulk_load=False
+            )
+        self.save_manifest(book_catalog, rental_history)
+        self.compact_embedding_cache(book_catalog)
+        
+        print("Incremental processing complete!")
+    
+    def iter_incremental_actions(self, book_catalog, changed_books, content_embeddings,
+                                 collaborative_factors, removed_ids, rentals_changed):
+        changed_ids = set()
+        if len(changed_books):
+            for book_id, doc in self.iter_book_docs(changed_books, content_embeddings, collaborative_factors):
+                changed_ids.add(book_id)
+                if rentals_changed:
+                    yield "index", book_id, doc
+                else:
+                    # Keep the stored collaborative_features; new books fall back to zeros
+                    partial = {k: v for k, v in doc.items() if k != 'collaborative_features'}
+                    yield "update", book_id, {"doc": partial, "upsert": doc}
+        
+        if rentals_changed:
+            # Item factors move for every book after a refit, but only that field needs rewriting
+            for book_id in book_catalog['book_id']:
+                book_id = int(book_id)
+                if book_id in changed_ids:
+                    continue
+                factors = np.nan_to_num(collaborative_factors[book_id], nan=0.0)
+                yield "update", book_id, {"doc": {"collaborative_features": factors.tolist()}}
+        
+        for book_id in removed_ids:
+            yield "delete", book_id, None
+
+    def ingest_rentals(self, events):
+        # Online path for new checkouts: append them to the rental history, fold
+        # the affected students and books into the saved factors, and rewrite
+        # only their collaborative_features. Precomputed lists of those students
+        # go stale by rental_count, so the app serves them live kNN until the
+        # next processing run.
+        if self.collaborative_trainer == 'svd':
+            print("Online rental ingestion needs COLLABORATIVE_TRAINER=als or bpr (SVD factors are not saved)")
+            return False
+        if self.vector_backend == 'local':
+            print("Online rental ingestion only supports OpenSearch, rerun python -m src.process_data")
+            return False
+        
+        if self.ingest_history is None:
+            if not os.path.exists(self.collaborative_factors_path):
+                print(f"No saved factors at {self.collaborative_factors_path}, run a full processing first")
+                return False
+            self.get_collaborative_model().load(self.collaborative_factors_path)
+            self.ingest_history = self.load_rental_history()
+            # Latest known name per student, for events that don't carry one
+            names = read_table(self.rental_history_path, columns=['user_id', 'student_name']).dropna()
+            self.ingest_names = dict(zip(names['user_id'].astype(str), names['student_name'].astype(str)))
+            # Rentals of books that were never indexed only update the model
+            self.ingest_book_ids = set(read_table(self.book_catalog_path, columns=['book_id'])['book_id'].astype(int))
+        
+        start = time.perf_counter()
+        events = events.dropna(subset=['user_id', 'book_id']).copy()
+        events['user_id'] = events['user_id'].astype(str)
+        events['book_id'] = events['book_id'].astype(int)
+        if not len(events):
+            return True
+        
+        self.ingest_history = pd.concat([self.ingest_history, events[RENTAL_COLUMNS]], ignore_index=True)
+        
+        model = self.collaborative_model
+        user_ids, book_ids = model.fold_in(
+            self.ingest_history, events['user_id'], events['book_id'], steps=self.fold_in_steps
+        )
+        model.save(self.collaborative_factors_path)
+        
+        trainset = model.trainset
+        book_actions = (
+            ("update", book_id,
+             {"doc": {"collaborative_features": np.nan_to_num(model.qi[trainset.item_positions[book_id]]).tolist()}})
+            for book_id in book_ids
+            if book_id in self.ingest_book_ids
+        )
+        self.bulk_index_docs(book_actions, index_name=self.index_alias, bulk_load=False)
+        
+        user_actions = []
+        for user_id in user_ids:
+            factors = np.nan_to_num(model.pu[trainset.user_positions[user_id]]).tolist()
+            user_actions.append(("update", user_id, {
+                "doc": {"collaborative_features": factors},
+                "upsert": {"user_id": user_id, "collaborative_features": factors},
+            }))
+        self.bulk_index_docs(user_actions, index_name=self.user_index_alias, bulk_load=False)
+        # Last, so a batch that failed to index is not in the history twice when retried
+        self.append_rentals(events)
+        
+        print(f"Ingested {len(events)} rentals, updated {len(user_ids)} students and {len(book_ids)} books "
+              f"in {time.perf_counter() - start:.1f}s")
+        return True
+    
+    def append_rentals(self, events):
+        # The CSV stays the source of truth; a Parquet copy that readers would
+        # prefer is regenerated so the app's data reload sees the new rentals
+        columns = pd.read_csv(self.rental_history_path, nrows=0).columns
+        rows = events.reindex(columns=columns)
+        if 'student_name' in rows.columns:
+            # The app shows each student's name from their newest rental, so a
+            # missing name must not replace a known one; new students get their id
+            known = rows['user_id'].map(self.ingest_names or {})
+            rows['student_name'] = rows['student_name'].fillna(known).fillna(rows['user_id'])
+            if self.ingest_names is not None:
+                self.ingest_names.update(zip(rows['user_id'], rows['student_name']))
+        
+        with open(self.rental_history_path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+        rows.to_csv(self.rental_history_path, mode='a', header=False, index=False)
+        
+        if resolve_source(self.rental_history_path).endswith('.parquet'):
+            convert(self.rental_history_path, RENTAL_DTYPES, parse_dates=RENTAL_DATE_COLUMNS)
+
+def parse_stages(value):
+    stages = [stage.strip() for stage in value.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown or not stages:
+        raise argparse.ArgumentTypeError(f"expected a comma-separated subset of {', '.join(STAGES)}")
+    return stages
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate embeddings and index books in OpenSearch")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--incremental', action='store_true',
+                      help="only re-embed and re-index books that changed since the last run")
+    mode.add_argument('--stream', action='store_true',
+                      help="read, encode and index the catalog in fixed-size chunks with flat memory")
+    mode.add_argument('--only', type=parse_stages, metavar='STAGES',
+                      help=f"run only these stages ({','.join(STAGES)}); the rest are read from the artifact bundle")
+    args = parser.parse_args()
+    
     processor = BookRecommendationProcessor()
-    processor.process_all()
\ No newline at end of file
+    try:
+        if args.only:
+            processor.process_stages(args.only)
+        elif args.incremental:
+            processor.process_incremental()
+        elif args.stream:
+            processor.process_streaming()
+        else:
+            processor.process_all()
+    finally:
+        processor.close()
\ No newline at end of file
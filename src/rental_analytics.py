@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+HISTORY_COLUMNS = ['student_name', 'title', 'author', 'genre', 'checkout_date', 'return_date']
+DISPLAY_COLUMNS = ['Student', 'Book Title', 'Author', 'Genre', 'Checkout Date', 'Return Date']
+
+
+class RentalAnalytics:
+    # Everything the Rental History page needs, built once per version of the
+    # source files: a categorical, pre-joined history sorted newest first,
+    # row positions per student, and per-student aggregates. Page renders only
+    # slice and format the rows they show.
+    def __init__(self, rental_history, book_catalog):
+        books = book_catalog.drop_duplicates('book_id').set_index('book_id')
+        history = pd.DataFrame({
+            "user_id": rental_history['user_id'].astype('category'),
+            "student_name": rental_history['student_name'].astype('category'),
+            "book_id": rental_history['book_id'],
+            "checkout_date": rental_history['checkout_date'],
+            "return_date": rental_history['return_date'],
+        })
+        for column in ['title', 'author', 'genre']:
+            history[column] = history['book_id'].map(books[column]).astype('category')
+
+        order = np.argsort(-history['checkout_date'].to_numpy().astype('int64'), kind='stable')
+        self.history = history.iloc[order].reset_index(drop=True)
+        self.return_dates = self.history['return_date'].to_numpy()
+        self.rows_by_user = self.history.groupby('user_id', observed=True, sort=False).indices
+
+        # Sorted by user_id (category order), names from each student's latest rental
+        self.students = (
+            self.history.groupby('user_id', observed=True)
+            .agg(
+                student_name=('student_name', 'first'),
+                rentals=('book_id', 'size'),
+                unique_books=('book_id', 'nunique'),
+                last_checkout=('checkout_date', 'max'),
+            )
+            .reset_index()
+        )
+        self.unique_books_by_user = dict(zip(self.students['user_id'], self.students['unique_books']))
+        self.student_labels = {
+            f"{name} ({user_id})": user_id
+            for user_id, name in zip(self.students['user_id'], self.students['student_name'])
+        }
+        self.unique_books = int(self.history['book_id'].nunique())
+
+    def rows(self, user_id=None):
+        if user_id is None:
+            return None
+        return self.rows_by_user.get(user_id, np.empty(0, dtype=np.int64))
+
+    def summary(self, user_id=None, now=None):
+        now = np.datetime64(now or pd.Timestamp.now())
+        rows = self.rows(user_id)
+        if rows is None:
+            return {
+                "rentals": len(self.history),
+                "students": len(self.students),
+                "books": self.unique_books,
+                "current": int(np.count_nonzero(self.return_dates > now)),
+            }
+
+        return {
+            "rentals": len(rows),
+            "students": 1 if len(rows) else 0,
+            "books": int(self.unique_books_by_user.get(user_id, 0)),
+            "current": int(np.count_nonzero(self.return_dates[rows] > now)),
+        }
+
+    def page(self, user_id=None, page=1, page_size=50):
+        rows = self.rows(user_id)
+        start = (page - 1) * page_size
+        if rows is None:
+            frame = self.history.iloc[start:start + page_size]
+        else:
+            frame = self.history.iloc[rows[start:start + page_size]]
+
+        display = frame[HISTORY_COLUMNS].astype(
+            {column: object for column in ['student_name', 'title', 'author', 'genre']}
+        )
+        display['checkout_date'] = display['checkout_date'].dt.strftime('%Y-%m-%d')
+        display['return_date'] = display['return_date'].dt.strftime('%Y-%m-%d')
+        display.columns = DISPLAY_COLUMNS
+        return display
+
+    def page_count(self, user_id=None, page_size=50):
+        rows = self.rows(user_id)
+        total = len(self.history) if rows is None else len(rows)
+        return max(1, -(-total // page_size))
@@ -0,0 +1,97 @@
+import argparse
+import io
+import os
+import time
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from src.process_data import BookRecommendationProcessor
+
+load_dotenv()
+
+# Online rental ingestion: new checkouts reach collaborative recommendations
+# in minutes instead of at the next full processing run.
+#
+#   python -m src.rental_ingest --file new_rentals.csv
+#   python -m src.rental_ingest --watch data/rental_events.csv
+#
+# Event files use the rental_history.csv columns (user_id, student_name,
+# book_id, checkout_date, return_date); return_date may be empty.
+
+
+class RentalEventFile:
+    # Tails an append-only CSV of checkouts. The byte offset of the last
+    # ingested line is kept next to it, so restarts neither skip nor repeat
+    # rentals; it only advances after a batch was ingested (commit()).
+    def __init__(self, path, offset_path=None):
+        self.path = path
+        self.offset_path = offset_path or f"{path}.offset"
+        self.offset = 0
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path) as f:
+                self.offset = int(f.read().strip() or 0)
+        self.pending_offset = self.offset
+
+    def read_new(self):
+        if not os.path.exists(self.path):
+            return None
+        if os.path.getsize(self.path) < self.offset:
+            print(f"{self.path} was truncated, reading it from the start")
+            self.offset = 0
+
+        with open(self.path, 'rb') as f:
+            header = f.readline()
+            start = max(self.offset, len(header))
+            f.seek(start)
+            data = f.read()
+
+        # A line still being written is left for the next poll
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return None
+        self.pending_offset = start + end
+        return pd.read_csv(io.BytesIO(header + data[:end]), dtype={"user_id": str, "student_name": str})
+
+    def commit(self):
+        self.offset = self.pending_offset
+        tmp_path = f"{self.offset_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(self.offset))
+        os.replace(tmp_path, self.offset_path)
+
+
+def watch(processor, events, interval):
+    print(f"Watching {events.path} every {interval:.0f}s (Ctrl+C to stop)")
+    while True:
+        batch = events.read_new()
+        if batch is not None and len(batch):
+            if not processor.ingest_rentals(batch):
+                return
+            events.commit()
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest new rentals and update collaborative factors in place")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help="ingest every rental in this CSV once")
+    source.add_argument('--watch', nargs='?', const=os.getenv('RENTAL_EVENTS_PATH', 'data/rental_events.csv'),
+                        help="poll an append-only CSV for new rentals (default: RENTAL_EVENTS_PATH)")
+    parser.add_argument('--interval', type=float, default=float(os.getenv('RENTAL_EVENTS_POLL_SECONDS', '30')),
+                        help="seconds between polls in --watch mode")
+    args = parser.parse_args()
+
+    processor = BookRecommendationProcessor()
+    try:
+        if not processor.connect_opensearch():
+            print("Failed to connect to OpenSearch")
+        elif args.file:
+            processor.ingest_rentals(pd.read_csv(args.file, dtype={"user_id": str, "student_name": str}))
+        else:
+            try:
+                watch(processor, RentalEventFile(args.watch), args.interval)
+            except KeyboardInterrupt:
+                print("Stopped watching")
+    finally:
+        processor.close()
@@ -0,0 +1,197 @@
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+from src.metrics import count, span, submit_in_context
+
+BEDROCK_MODEL_ID = "us.anthropic.claude-3-haiku-20240307-v1:0"
+# Bump whenever the prompt text changes so cached snippets are regenerated
+PROMPT_VERSION = 1
+
+
+def build_prompt(user_book, recommended_book):
+    return f"""
+        Create a short, engaging recommendation snippet (1-2 sentences) explaining why someone who enjoyed "{user_book['title']}" by {user_book['author']} would like "{recommended_book['title']}" by {recommended_book['author']}.
+
+        User's book: {user_book['description']}
+        Recommended book: {recommended_book['description']}
+
+        Start with "Because you liked..." and make it personal and specific.
+        """
+
+
+class FallbackSnippet(str):
+    # Generic text shown when Bedrock fails or times out; displays like any
+    # snippet but is never cached or stored, so the pair is retried later
+    pass
+
+
+def fallback_snippet(user_book):
+    return FallbackSnippet(f"You might enjoy this book based on your interest in {user_book['genre']} stories.")
+
+
+def invoke_snippet(bedrock_client, user_book, recommended_book, model_id=BEDROCK_MODEL_ID):
+    body = json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 100,
+        "messages": [
+            {
+                "role": "user",
+                "content": build_prompt(user_book, recommended_book)
+            }
+        ]
+    })
+
+    with span('bedrock_invoke', model=model_id):
+        response = bedrock_client.invoke_model(
+            body=body,
+            modelId=model_id,
+            accept="application/json",
+            contentType="application/json"
+        )
+
+    response_body = json.loads(response.get('body').read())
+    return response_body['content'][0]['text'].strip()
+
+
+class StubBedrockClient:
+    # Offline stand-in for the bedrock-runtime client (BEDROCK_STUB=true)
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def invoke_model(self, body, modelId, accept=None, contentType=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        prompt = json.loads(body)['messages'][0]['content']
+        titles = re.findall(r'"([^"]+)"', prompt)
+        liked, recommended = (titles + ['this book', 'this one'])[:2]
+        text = f"Because you liked {liked}, you might enjoy {recommended} for many of the same reasons."
+        payload = json.dumps({"content": [{"type": "text", "text": text}]})
+        return {"body": io.BytesIO(payload.encode('utf-8'))}
+
+
+class SnippetCache:
+    # Persistent snippet store keyed by book pair, prompt version and model id,
+    # with TTL expiry and least-recently-used eviction beyond max_entries
+    def __init__(self, path='data/snippet_cache.sqlite3', ttl=30 * 24 * 3600, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.puts = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS snippets ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def key(user_book_id, rec_book_id, model_id=BEDROCK_MODEL_ID, prompt_version=PROMPT_VERSION):
+        return f"{user_book_id}:{rec_book_id}:{prompt_version}:{model_id}"
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT text, created_at FROM snippets WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM snippets WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE snippets SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key, text):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snippets (key, text, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, now, now)
+            )
+            self.conn.commit()
+            self.puts += 1
+        if self.puts % 100 == 0:
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            if self.ttl:
+                self.conn.execute("DELETE FROM snippets WHERE created_at < ?", (time.time() - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM snippets WHERE key IN ("
+                "SELECT key FROM snippets ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self.conn.commit()
+
+
+class SnippetGenerator:
+    def __init__(self, bedrock_client, cache=None, max_workers=5, timeout=10.0, model_id=BEDROCK_MODEL_ID):
+        self.bedrock_client = bedrock_client
+        self.cache = cache
+        self.timeout = timeout
+        self.model_id = model_id
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='snippets')
+
+    def cache_key(self, user_book, recommended_book):
+        return SnippetCache.key(user_book['book_id'], recommended_book['book_id'], self.model_id)
+
+    def cached(self, user_book, recommended_book):
+        if self.cache is None:
+            return None
+        snippet = self.cache.get(self.cache_key(user_book, recommended_book))
+        count('snippet_cache_lookups_total', result='miss' if snippet is None else 'hit')
+        return snippet
+
+    def generate(self, user_book, recommended_book):
+        snippet = self.cached(user_book, recommended_book)
+        if snippet is not None:
+            return snippet
+
+        try:
+            snippet = invoke_snippet(self.bedrock_client, user_book, recommended_book, self.model_id)
+        except Exception:
+            # Fallbacks are not cached so the pair is retried next time
+            count('snippet_fallbacks_total', reason='error')
+            return fallback_snippet(user_book)
+
+        if self.cache is not None:
+            self.cache.put(self.cache_key(user_book, recommended_book), snippet)
+        return snippet
+
+    def generate_many(self, pairs):
+        # Yields (position, snippet) as each one becomes available: cache hits
+        # first, then Bedrock calls in completion order, then timeouts
+        pending = {}
+        for i, (user_book, recommended_book) in enumerate(pairs):
+            snippet = self.cached(user_book, recommended_book)
+            if snippet is not None:
+                yield i, snippet
+            else:
+                pending[submit_in_context(self.executor, self.generate, user_book, recommended_book)] = i
+
+        done = set()
+        try:
+            for future in as_completed(pending, timeout=self.timeout):
+                done.add(future)
+                yield pending[future], future.result()
+        except FuturesTimeoutError:
+            for future, i in pending.items():
+                if future not in done:
+                    count('snippet_fallbacks_total', reason='timeout')
+                    yield i, fallback_snippet(pairs[i][0])
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from src.benchmark import summarize
+
+# Cold-start timings: every probe runs in a fresh interpreter, so module
+# imports, model loads and connection attempts are paid in full each time,
+# the way they are on a new Streamlit worker or a cron-started processing run:
+#
+#   python -m src.startup_benchmark --repeats 5 --output startup.json
+#
+# "seconds" is the timed statement inside the interpreter; "process" also
+# counts interpreter startup and exit.
+
+PROBES = {
+    "import_process_data": ("", "import src.process_data"),
+    "processor_init": (
+        "from src.process_data import BookRecommendationProcessor",
+        "BookRecommendationProcessor()",
+    ),
+    # How long a bad endpoint takes to be reported, before any data or model is loaded
+    "connect_failure": (
+        "from src.process_data import BookRecommendationProcessor\n"
+        "processor = BookRecommendationProcessor()",
+        "assert not processor.connect_opensearch()",
+    ),
+    "import_app": ("", "import app"),
+}
+ENCODE_PROBE = (
+    "from src.encoder import SentenceEncoder\n"
+    "encoder = SentenceEncoder('all-MiniLM-L6-v2', backend=os.getenv('ENCODE_BACKEND', 'torch'))",
+    "encoder.encode(['A first query after a cold start'])",
+)
+
+PROBE_TEMPLATE = """
+import json, os, resource, sys, time
+{setup}
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": len(sys.modules),
+                  "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+
+def run_probe(setup, statement, env):
+    code = PROBE_TEMPLATE.format(setup=setup, statement=statement)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env)
+    process_seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed")
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample['process_seconds'] = process_seconds
+    return sample
+
+
+def run_startup_benchmark(args):
+    env = dict(os.environ, PYTHONPATH=os.getcwd(), METRICS_PORT='', METRICS_FILE='',
+               # Nothing listens here, so the connection is refused immediately
+               OPENSEARCH_HOST='127.0.0.1', OPENSEARCH_PORT=str(args.unreachable_port))
+
+    probes = dict(PROBES)
+    if args.encode or 'first_encode' in (args.probes or ()):
+        probes['first_encode'] = ENCODE_PROBE
+    if args.probes:
+        probes = {name: probes[name] for name in args.probes}
+
+    results = {}
+    for name, (setup, statement) in probes.items():
+        try:
+            samples = [run_probe(setup, statement, env) for _ in range(args.repeats)]
+        except RuntimeError as e:
+            # e.g. streamlit or sentence-transformers not installed
+            print(f"{name:22} skipped: {e}")
+            results[name] = {"error": str(e)}
+            continue
+        results[name] = {
+            "seconds": summarize([sample['seconds'] for sample in samples]),
+            "process": summarize([sample['process_seconds'] for sample in samples]),
+            "modules": samples[-1]['modules'],
+            # Linux reports kilobytes, macOS bytes
+            "peak_rss_mb": samples[-1]['peak_rss'] / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        }
+        print(f"{name:22} p50={results[name]['seconds']['p50_ms']:.0f}ms "
+              f"(process {results[name]['process']['p50_ms']:.0f}ms), "
+              f"{results[name]['modules']} modules, peak RSS {results[name]['peak_rss_mb']:.0f} MB")
+
+    report = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "repeats": args.repeats,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "probes": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time cold imports, processor startup and connection failure")
+    parser.add_argument('--repeats', type=int, default=5, help="fresh interpreters per probe (median is reported)")
+    parser.add_argument('--probes', nargs='+', choices=list(PROBES) + ['first_encode'], help="only run these probes")
+    parser.add_argument('--encode', action='store_true', help="also time loading the model for a first encode")
+    parser.add_argument('--unreachable-port', type=int, default=9,
+                        help="local port with no OpenSearch for the connect_failure probe")
+    parser.add_argument('--output', help="write the results as JSON")
+    run_startup_benchmark(parser.parse_args())
@@ -0,0 +1,107 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Generates book_catalog.csv / rental_history.csv at benchmark scale with the
+# same columns as data/, description lengths similar to real catalog blurbs
+# and Zipf-skewed borrowing (a few popular books and very active readers):
+#
+#   python -m src.synthetic_data --scale 100k --out data/synthetic/100k
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+GENRES = [
+    'Fantasy', 'Science Fiction', 'Mystery', 'Adventure', 'Realistic Fiction', 'Historical Fiction',
+    'Non-fiction', 'Biography', 'Graphic Novel', 'Poetry', 'Humor', 'Horror',
+]
+WORDS = (
+    "a an the young old brave curious quiet secret hidden lost ancient magical ordinary strange "
+    "girl boy friend family teacher dragon robot detective wizard scientist explorer pirate king queen "
+    "school city forest ocean island mountain village planet kingdom library museum river desert "
+    "journey mystery adventure friendship courage discovery war peace storm summer winter night "
+    "learns finds discovers must save solve escape build travel protect uncover question face "
+    "with through across beyond under between against into about after before during "
+    "heart mind world time stars light shadow fire water memory dream truth promise map key door"
+).split()
+FIRST_NAMES = "Ava Ben Chloe Diego Emma Farah Gabe Hana Ivan Jada Kai Lena Milo Nora Omar Priya Quinn Rosa Sam Tara".split()
+LAST_NAMES = "Adams Brooks Chen Diaz Evans Foster Garcia Hughes Ito Jones Kim Lopez Moore Nguyen Ortiz Patel Reed Smith Tran Walsh".split()
+
+
+def zipf_weights(n, exponent, rng):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def generate_catalog(n_books, rng):
+    # ~35 words on average with a long tail, like publisher blurbs
+    lengths = np.clip(rng.lognormal(mean=3.5, sigma=0.35, size=n_books).astype(int), 8, 120)
+    words = np.asarray(WORDS)
+    descriptions = [' '.join(rng.choice(words, size=length)).capitalize() + '.' for length in lengths]
+    titles = [' '.join(rng.choice(words, size=rng.integers(2, 6))).title() for _ in range(n_books)]
+    authors = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(n_books)]
+
+    return pd.DataFrame({
+        "book_id": np.arange(1, n_books + 1),
+        "title": titles,
+        "author": authors,
+        "isbn": [f"978-{10**9 + i:010d}" for i in range(n_books)],
+        "description": descriptions,
+        "genre": rng.choice(GENRES, size=n_books),
+        "publication_year": rng.integers(1950, 2025, size=n_books),
+    })
+
+
+def generate_rentals(n_rentals, n_users, n_books, rng, book_skew=1.1, user_skew=0.8):
+    user_ids = [f"student_{i:07d}" for i in range(n_users)]
+    names = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(n_users)]
+
+    users = rng.choice(n_users, size=n_rentals, p=zipf_weights(n_users, user_skew, rng))
+    books = rng.choice(n_books, size=n_rentals, p=zipf_weights(n_books, book_skew, rng)) + 1
+    checkout = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 3 * 365, size=n_rentals), unit='D')
+    returned = checkout + pd.to_timedelta(rng.integers(7, 29, size=n_rentals), unit='D')
+
+    rentals = pd.DataFrame({
+        "user_id": np.asarray(user_ids)[users],
+        "student_name": np.asarray(names)[users],
+        "book_id": books,
+        "checkout_date": checkout.strftime('%Y-%m-%d'),
+        "return_date": returned.strftime('%Y-%m-%d'),
+    })
+    # Rental files are appended chronologically
+    return rentals.sort_values('checkout_date', kind='stable').reset_index(drop=True)
+
+
+def generate(out_dir, n_books, n_rentals, n_users=None, seed=0):
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(10, n_rentals // 20)
+    os.makedirs(out_dir, exist_ok=True)
+
+    catalog_path = os.path.join(out_dir, 'book_catalog.csv')
+    rental_path = os.path.join(out_dir, 'rental_history.csv')
+    generate_catalog(n_books, rng).to_csv(catalog_path, index=False)
+    generate_rentals(n_rentals, n_users, n_books, rng).to_csv(rental_path, index=False)
+    print(f"Wrote {n_books} books and {n_rentals} rentals for {n_users} students to {out_dir}")
+    return catalog_path, rental_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic catalog and rental history CSVs")
+    parser.add_argument('--scale', choices=SCALES, default='10k', help="rows in each file")
+    parser.add_argument('--books', type=int, help="override the number of books")
+    parser.add_argument('--rentals', type=int, help="override the number of rentals")
+    parser.add_argument('--users', type=int, help="number of students (default: rentals / 20)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="output directory (default: data/synthetic/<scale>)")
+    args = parser.parse_args()
+
+    rows = SCALES[args.scale]
+    generate(
+        args.out or os.path.join('data', 'synthetic', args.scale),
+        args.books or rows,
+        args.rentals or rows,
+        n_users=args.users,
+        seed=args.seed,
+    )
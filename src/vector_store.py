@@ -0,0 +1,317 @@
+import asyncio
+import json
+import os
+
+import numpy as np
+from opensearchpy import NotFoundError
+
+from src.book_store import BOOK_FIELDS, VECTOR_FIELDS, AsyncBookStore, BookStore
+from src.generations import new_generation_dir, publish_generation
+from src.index_settings import dequantize_byte, quantize_byte
+from src.precompute import normalize_rows, top_k
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Content vectors are compared by cosine, collaborative factors by dot product
+NORMALIZED_FIELDS = {'content_embedding'}
+
+
+def knn_request_body(index, field, query_vectors, k, exclude_ids=()):
+    exclude_ids = [int(book_id) for book_id in exclude_ids]
+    # Over-fetch by the number of excluded books so the must_not post-filter still leaves k hits
+    candidates = k + len(exclude_ids)
+    body = []
+    for vector in query_vectors:
+        query = {"knn": {field: {"vector": vector, "k": candidates}}}
+        if exclude_ids:
+            query = {"bool": {"must": [query], "must_not": [{"terms": {"book_id": exclude_ids}}]}}
+        body.append({"index": index})
+        body.append({"size": k, "_source": {"excludes": VECTOR_FIELDS}, "query": query})
+    return body
+
+
+def encode_query_vector(field, vector, byte_fields):
+    if field in byte_fields:
+        return quantize_byte(vector)
+    return np.asarray(vector, dtype=float).tolist()
+
+
+def decode_vectors(field, vectors, byte_fields):
+    # Callers always see float vectors, whatever the field is stored as
+    if field in byte_fields:
+        return {book_id: dequantize_byte(vector) for book_id, vector in vectors.items()}
+    return vectors
+
+
+def knn_response_hits(response):
+    results = []
+    for result in response['responses']:
+        if 'error' in result:
+            raise RuntimeError(f"k-NN search failed: {result['error']}")
+        results.append([hit['_source'] for hit in result['hits']['hits']])
+    return results
+
+
+class OpenSearchVectorStore:
+    # byte_fields are stored as int8 (KNN_VECTOR_ENCODING=byte); callers always
+    # see float vectors and queries are quantized on the way out
+    concurrent = False
+
+    def __init__(self, client, book_store=None, index="books", user_index="users", byte_fields=(), health=None):
+        self.client = client
+        self.index = index
+        self.user_index = user_index
+        self.book_store = book_store or BookStore(client, index=index)
+        self.byte_fields = set(byte_fields)
+        self.health = health
+
+    def ping(self):
+        if self.health is not None:
+            return self.health.ok()
+        return self.client.ping()
+
+    def batch(self, *calls):
+        # (method name, *args) tuples; run one after another on the sync client
+        return [getattr(self, name)(*args) for name, *args in calls]
+
+    def get_books(self, book_ids):
+        return self.book_store.get_books(book_ids)
+
+    def get_vectors(self, book_ids, field='content_embedding'):
+        return decode_vectors(field, self.book_store.get_vectors(book_ids, field), self.byte_fields)
+
+    def get_user_document(self, user_id):
+        try:
+            user = self.client.get(index=self.user_index, id=user_id, _source_excludes=['collaborative_features'])
+        except NotFoundError:
+            return None
+        return user['_source']
+
+    def get_user_vector(self, user_id):
+        try:
+            user = self.client.get(index=self.user_index, id=user_id, _source_includes=['collaborative_features'])
+        except NotFoundError:
+            return None
+        return user['_source'].get('collaborative_features')
+
+    def knn(self, field, vectors, k, exclude_ids=()):
+        query_vectors = [encode_query_vector(field, vector, self.byte_fields) for vector in vectors]
+        response = self.client.msearch(body=knn_request_body(self.index, field, query_vectors, k, exclude_ids))
+        return knn_response_hits(response)
+
+
+class AsyncOpenSearchVectorStore:
+    # Same interface over AsyncOpenSearch (OPENSEARCH_ASYNC=true). Each method
+    # has a coroutine twin (aget_books, aknn, ...) and batch() sends
+    # independent calls concurrently on the shared event loop.
+    concurrent = True
+
+    def __init__(self, client, loop, book_store=None, index="books", user_index="users", byte_fields=(),
+                 health=None, max_entries=10000, ttl=300):
+        self.client = client
+        self.loop = loop
+        self.index = index
+        self.user_index = user_index
+        self.book_store = book_store or AsyncBookStore(client, index=index, max_entries=max_entries, ttl=ttl)
+        self.byte_fields = set(byte_fields)
+        self.health = health
+
+    def ping(self):
+        if self.health is not None:
+            return self.health.ok()
+        return self.loop.run(self.client.ping())
+
+    def batch(self, *calls):
+        coroutines = [getattr(self, f"a{name}")(*args) for name, *args in calls]
+        return self.loop.run(self.gather(coroutines))
+
+    async def gather(self, coroutines):
+        return await asyncio.gather(*coroutines)
+
+    async def aget_books(self, book_ids):
+        return await self.book_store.aget_books(book_ids)
+
+    async def aget_vectors(self, book_ids, field='content_embedding'):
+        return decode_vectors(field, await self.book_store.aget_vectors(book_ids, field), self.byte_fields)
+
+    async def aget_user_document(self, user_id):
+        try:
+            user = await self.client.get(index=self.user_index, id=user_id, _source_excludes=['collaborative_features'])
+        except NotFoundError:
+            return None
+        return user['_source']
+
+    async def aget_user_vector(self, user_id):
+        try:
+            user = await self.client.get(index=self.user_index, id=user_id, _source_includes=['collaborative_features'])
+        except NotFoundError:
+            return None
+        return user['_source'].get('collaborative_features')
+
+    async def aknn(self, field, vectors, k, exclude_ids=()):
+        query_vectors = [encode_query_vector(field, vector, self.byte_fields) for vector in vectors]
+        response = await self.client.msearch(body=knn_request_body(self.index, field, query_vectors, k, exclude_ids))
+        return knn_response_hits(response)
+
+    def get_books(self, book_ids):
+        return self.loop.run(self.aget_books(book_ids))
+
+    def get_vectors(self, book_ids, field='content_embedding'):
+        return self.loop.run(self.aget_vectors(book_ids, field))
+
+    def get_user_document(self, user_id):
+        return self.loop.run(self.aget_user_document(user_id))
+
+    def get_user_vector(self, user_id):
+        return self.loop.run(self.aget_user_vector(user_id))
+
+    def knn(self, field, vectors, k, exclude_ids=()):
+        return self.loop.run(self.aknn(field, vectors, k, exclude_ids))
+
+
+class LocalVectorStore:
+    # In-process backend over the artifacts written by write_local_store:
+    # memory-mapped float32 matrices searched with a BLAS matrix product, or
+    # an hnswlib graph when one was built and hnswlib is installed
+    def __init__(self, path, book_catalog, use_hnsw=True):
+        generation = read_current_generation(path)
+        if generation is None:
+            raise FileNotFoundError(f"No vector store generation found in {path}")
+        self.path = os.path.join(path, generation)
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        self.book_ids = np.asarray(meta['book_ids'], dtype=np.int64)
+        self.positions = {int(book_id): pos for pos, book_id in enumerate(self.book_ids)}
+        self.matrices = {
+            field: self.load_matrix(f"{field}.f32", len(self.book_ids), dim)
+            for field, dim in meta['fields'].items()
+        }
+
+        self.user_positions = {user_id: pos for pos, user_id in enumerate(meta['user_ids'])}
+        self.user_matrix = self.load_matrix('user_factors.f32', len(meta['user_ids']), meta['user_dim'])
+        with open(os.path.join(self.path, 'users.json')) as f:
+            self.user_documents = json.load(f)
+
+        self.graphs = {}
+        if use_hnsw and hnswlib is not None:
+            for field, dim in meta['fields'].items():
+                graph_path = os.path.join(self.path, f"{field}.hnsw")
+                if os.path.exists(graph_path):
+                    space = 'cosine' if field in NORMALIZED_FIELDS else 'ip'
+                    graph = hnswlib.Index(space=space, dim=dim)
+                    graph.load_index(graph_path, max_elements=len(self.book_ids))
+                    graph.set_ef(int(os.getenv('HNSW_EF_SEARCH', '100')))
+                    self.graphs[field] = graph
+
+        self.books = {
+            int(book['book_id']): book
+            for book in book_catalog[BOOK_FIELDS].to_dict('records')
+        }
+
+    def load_matrix(self, name, rows, dim):
+        if rows == 0:
+            return np.empty((0, dim), dtype=np.float32)
+        return np.memmap(os.path.join(self.path, name), dtype=np.float32, mode='r', shape=(rows, dim))
+
+    concurrent = False
+
+    def ping(self):
+        return True
+
+    def batch(self, *calls):
+        return [getattr(self, name)(*args) for name, *args in calls]
+
+    def get_books(self, book_ids):
+        return {int(book_id): self.books[int(book_id)] for book_id in book_ids if int(book_id) in self.books}
+
+    def get_vectors(self, book_ids, field='content_embedding'):
+        matrix = self.matrices[field]
+        return {
+            int(book_id): np.asarray(matrix[self.positions[int(book_id)]])
+            for book_id in book_ids
+            if int(book_id) in self.positions
+        }
+
+    def get_user_document(self, user_id):
+        # Stored under str ids, like the users index's document _ids
+        return self.user_documents.get(str(user_id))
+
+    def get_user_vector(self, user_id):
+        pos = self.user_positions.get(str(user_id))
+        return None if pos is None else np.asarray(self.user_matrix[pos])
+
+    def knn(self, field, vectors, k, exclude_ids=()):
+        queries = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        if field in NORMALIZED_FIELDS:
+            queries = normalize_rows(queries)
+        excluded = [self.positions[int(book_id)] for book_id in exclude_ids if int(book_id) in self.positions]
+
+        if field in self.graphs:
+            candidates = min(k + len(excluded), len(self.book_ids))
+            labels, _ = self.graphs[field].knn_query(queries, k=candidates)
+            excluded = set(excluded)
+            ranked = [[pos for pos in row if pos not in excluded][:k] for row in labels]
+        else:
+            scores = queries @ self.matrices[field].T
+            scores[:, excluded] = -np.inf
+            top = top_k(scores, k)
+            ranked = [
+                [pos for pos in row if np.isfinite(scores[i, pos])]
+                for i, row in enumerate(top)
+            ]
+
+        return [[self.books[int(self.book_ids[pos])] for pos in row] for row in ranked]
+
+
+def read_current_generation(path):
+    current_path = os.path.join(path, 'CURRENT')
+    if not os.path.exists(current_path):
+        return None
+    with open(current_path) as f:
+        return f.read().strip()
+
+
+def write_local_store(path, book_ids, fields, user_factors, user_documents=None,
+                      build_hnsw=False, generations_to_keep=2):
+    # Same generation/alias scheme as the OpenSearch indexes: write a new
+    # directory, then atomically repoint CURRENT at it and prune old ones
+    generation = new_generation_dir(path)
+    generation_path = os.path.join(path, generation)
+
+    meta = {"book_ids": [int(book_id) for book_id in book_ids], "fields": {}}
+    for field, matrix in fields.items():
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if field in NORMALIZED_FIELDS:
+            matrix = normalize_rows(matrix)
+        matrix.tofile(os.path.join(generation_path, f"{field}.f32"))
+        meta['fields'][field] = int(matrix.shape[1])
+
+        if build_hnsw and hnswlib is not None and len(matrix):
+            graph = hnswlib.Index(space='cosine' if field in NORMALIZED_FIELDS else 'ip', dim=matrix.shape[1])
+            graph.init_index(
+                max_elements=len(matrix),
+                M=int(os.getenv('HNSW_M', '16')),
+                ef_construction=int(os.getenv('HNSW_EF_CONSTRUCTION', '200'))
+            )
+            graph.add_items(matrix, np.arange(len(matrix)))
+            graph.save_index(os.path.join(generation_path, f"{field}.hnsw"))
+
+    user_ids = [str(user_id) for user_id in user_factors]
+    user_matrix = np.asarray([user_factors[user_id] for user_id in user_factors], dtype=np.float32)
+    user_dim = int(user_matrix.shape[1]) if len(user_matrix) else 0
+    user_matrix.tofile(os.path.join(generation_path, 'user_factors.f32'))
+    meta['user_ids'] = user_ids
+    meta['user_dim'] = user_dim
+
+    with open(os.path.join(generation_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    with open(os.path.join(generation_path, 'users.json'), 'w') as f:
+        json.dump({str(user_id): doc for user_id, doc in (user_documents or {}).items()}, f)
+
+    publish_generation(path, generation, generations_to_keep)
+
+    return generation_path